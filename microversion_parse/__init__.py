@@ -11,40 +11,100 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+import bisect
 import collections
-from collections.abc import Iterable, MutableMapping, Sequence
-from typing import Any, TYPE_CHECKING
-
-if TYPE_CHECKING:
-    from typing_extensions import Self
+import functools
+import itertools
+import os
+import sys
+import threading
+import time
+import weakref
+from collections.abc import (
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    MutableMapping,
+    Sequence,
+)
+from typing import Any, Generic, Protocol, TypeVar
 
 ENVIRON_HTTP_HEADER_FMT = 'http_{}'
 STANDARD_HEADER = 'openstack-api-version'
 
 
+_NO_VERSION = (-1, 0)
+
+_T = TypeVar('_T')
+_F = TypeVar('_F', bound=Callable[..., Any])
+
+
 class Version(collections.namedtuple('Version', 'major minor')):
-    """A namedtuple containing major and minor values.
+    """An immutable namedtuple containing major and minor values.
+
+    Since it is a tuple, it is automatically comparable, and serializes as
+    ``[major, minor]``.
 
-    Since it is a tuple, it is automatically comparable.
+    The optional ``min_version`` and ``max_version`` are the extremes of the
+    versions supported by the service the version was negotiated for. They
+    are not taken into account when comparing versions.
     """
 
-    max_version: tuple[int, int]
-    min_version: tuple[int, int]
+    major: int
+    minor: int
+
+    # Unbounded versions share these class defaults, so only a version
+    # created with extremes has them set on the instance.
+    min_version: 'VersionTuple' = _NO_VERSION
+    max_version: 'VersionTuple' = _NO_VERSION
 
-    def __new__(cls, major: int, minor: int) -> 'Self':
+    def __new__(
+        cls,
+        major: int,
+        minor: int,
+        *,
+        min_version: 'VersionTuple' = _NO_VERSION,
+        max_version: 'VersionTuple' = _NO_VERSION,
+    ) -> 'Version':
         """Add min and max version attributes to the tuple."""
-        self = super().__new__(cls, major, minor)
-        self.max_version = (-1, 0)
-        self.min_version = (-1, 0)
+        self = tuple.__new__(cls, (major, minor))
+        if min_version is not _NO_VERSION:
+            object.__setattr__(self, 'min_version', min_version)
+        if max_version is not _NO_VERSION:
+            object.__setattr__(self, 'max_version', max_version)
         return self
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (
+            _make_version,
+            (self.major, self.minor, self.min_version, self.max_version),
+        )
+
     def __str__(self) -> str:
         return f'{self.major}.{self.minor}'
 
+    def _replace(self, **kwargs: Any) -> 'Version':
+        """Make a new Version, replacing the given attributes."""
+        return Version(
+            kwargs.pop('major', self.major),
+            kwargs.pop('minor', self.minor),
+            min_version=kwargs.pop('min_version', self.min_version),
+            max_version=kwargs.pop('max_version', self.max_version),
+            **kwargs,
+        )
+
     def matches(
         self,
-        min_version: tuple[int, int] | None = None,
-        max_version: tuple[int, int] | None = None,
+        min_version: 'VersionTuple | None' = None,
+        max_version: 'VersionTuple | None' = None,
     ) -> bool:
         """Is this version within min_version and max_version."""
         # NOTE(cdent): min_version and max_version are expected
@@ -57,15 +117,51 @@ class Version(collections.namedtuple('Version', 'major minor')):
         return min_version <= self <= max_version
 
 
+VersionTuple = Version | tuple[int, int]
+
+
+class _SupportsItems(Protocol):
+    """Headers which are not a dict, but have an ``items`` method."""
+
+    def items(self) -> Iterable[tuple[str, Any]]: ...
+
+
+# Headers may be a dict-like object, including a WSGI environ, or a list of
+# header name and value tuples, either as str or as raw bytes.
+Headers = (
+    Mapping[str, Any]
+    | _SupportsItems
+    | Iterable[tuple[str, str]]
+    | Iterable[tuple[bytes, bytes]]
+)
+
+
+def _make_version(
+    major: int,
+    minor: int,
+    min_version: VersionTuple,
+    max_version: VersionTuple,
+) -> Version:
+    """Recreate a pickled Version."""
+    return Version(
+        major, minor, min_version=min_version, max_version=max_version
+    )
+
+
 def get_version(
-    headers: Iterable[tuple[str, str]] | MutableMapping[str, str],
-    service_type: str,
+    headers: 'Headers',
+    service_type: 'str | HeaderLookup',
     legacy_headers: Iterable[str] | None = None,
+    cache: 'HeaderCache | None' = None,
+    stats: 'MicroversionStats | None' = None,
 ) -> str | None:
     """Parse a microversion out of headers
 
     If headers is not a dict we assume is an iterator of tuple-like headers,
-    which we will fold into a dict.
+    which we will fold into a dict. Dict-like headers, including a WSGI
+    environ and webob's request headers, are read in place without being
+    copied. Other objects with an ``items`` method, such as
+    ``http.client.HTTPMessage``, have their items folded.
 
     The flow is that we first look for the new standard singular header:
 
@@ -80,24 +176,307 @@ def get_version(
 
     Folded headers are joined by ``,``.
 
+    Services which look for the same legacy headers on every request can
+    build a :class:`~HeaderLookup` once and pass it as ``service_type``.
+
     :param headers: The headers of a request, dict or list
-    :param service_type: The service type being looked for in the headers
+    :param service_type: The service type being looked for in the headers,
+        or a :class:`~HeaderLookup` for the service type and legacy headers
     :param legacy_headers: Other headers to look at for a version
+    :param cache: An optional :class:`~HeaderCache` in which to remember
+        the result of parsing the standard header
+    :param stats: An optional :class:`~MicroversionStats` in which to
+        record what was found and how long it took
     :returns: a version string or "latest"
     :raises: ValueError
     """
+    return _lookup(service_type, legacy_headers).get_version(
+        headers, cache, stats
+    )
 
-    folded_headers = fold_headers(headers)
 
-    version = check_standard_header(folded_headers, service_type)
-    if version:
-        return version
+class HeaderLookup:
+    """A precompiled plan for finding the microversion of a service.
+
+    Finding a microversion means looking for the standard header and then
+    for each legacy header, in any of the forms its name may take in a dict
+    of headers or a WSGI environ. A ``HeaderLookup`` works out all those
+    forms once, so that finding the microversion in a request is only a
+    matter of dict lookups.
+
+    So that clients cannot make every request do work in proportion to an
+    enormous header, a ``HeaderLookup`` may also limit the length of the
+    microversion headers and the number of comma separated entries in
+    them. A header beyond those limits is rejected with
+    :class:`~HeaderTooLarge` before it is parsed. In a list of headers,
+    every microversion header is checked as its values are folded, so
+    that folding stops at the first value beyond the limits.
+    """
+
+    def __init__(
+        self,
+        service_type: str,
+        legacy_headers: Iterable[str] | None = None,
+        max_header_length: int | None = None,
+        max_entries: int | None = None,
+    ) -> None:
+        """Create the lookup plan.
+
+        :param service_type: The service type being looked for in the
+            headers
+        :param legacy_headers: Other headers to look at for a version
+        :param max_header_length: The length of the longest microversion
+            header accepted, or None for no limit.
+        :param max_entries: The largest number of comma separated entries
+            accepted in a microversion header, or None for no limit.
+        """
+        self.service_type = service_type
+        self.max_header_length = max_header_length
+        self.max_entries = max_entries
+        self._limited = (
+            max_header_length is not None or max_entries is not None
+        )
+        self.legacy_headers = tuple(legacy_headers or ())
+        self._legacy_header_names = tuple(
+            _header_names(legacy_header)
+            for legacy_header in self.legacy_headers
+        )
+
+    @functools.cached_property
+    def _wanted_headers(
+        self,
+    ) -> tuple[dict[str | bytes, str], frozenset[int]]:
+        """The header names to fold, needed only for lists of headers."""
+        return _wanted_headers(
+            [_STANDARD_HEADER_NAMES, *self._legacy_header_names]
+        )
+
+    def get_version(
+        self,
+        headers: 'Headers',
+        cache: 'HeaderCache | None' = None,
+        stats: 'MicroversionStats | None' = None,
+    ) -> str | None:
+        """Parse a microversion out of headers.
+
+        This behaves as :func:`get_version`.
+        """
+        if stats is None:
+            return self._find(headers, cache, None)[0]
+        start = time.perf_counter()
+        try:
+            return self.find(headers, cache, stats)[0]
+        finally:
+            stats.observe('parse', time.perf_counter() - start)
+
+    def find(
+        self,
+        headers: 'Headers',
+        cache: 'HeaderCache | None' = None,
+        stats: 'MicroversionStats | None' = None,
+    ) -> tuple[str | None, 'Version | None']:
+        """Find the version string and, if it is cached, the parsed Version.
+
+        :param headers: The headers of a request, dict or list
+        :param cache: An optional :class:`~HeaderCache` in which to remember
+            the result of parsing the standard header
+        :param stats: An optional :class:`~MicroversionStats` in which to
+            count whether a version, or ``latest``, was found and whether it
+            was found in ``cache``
+        :returns: A tuple of the version string, or None, and the parsed
+            :class:`~Version` when ``cache`` has one for the version string.
+        """
+        version_string, version, _, _ = self._find(headers, cache, stats)
+        if stats is not None:
+            _count_found(stats, version_string)
+        return version_string, version
+
+    def find_header(
+        self,
+        headers: 'Headers',
+        cache: 'HeaderCache | None' = None,
+        stats: 'MicroversionStats | None' = None,
+    ) -> tuple[str | None, 'Version | None', str | None, str | None]:
+        """Find the version as :meth:`find` does, and the header it was in.
+
+        :returns: A tuple of the version string, or None, the parsed
+            :class:`~Version` when ``cache`` has one for the version string,
+            the lowercased name of the header the version was found in, or
+            None, and the value of that header, or None.
+        """
+        found = self._find(headers, cache, stats)
+        if stats is not None:
+            _count_found(stats, found[0])
+        return found
+
+    def _find(
+        self,
+        headers: 'Headers',
+        cache: 'HeaderCache | None',
+        stats: 'MicroversionStats | None',
+    ) -> tuple[str | None, 'Version | None', str | None, str | None]:
+        """Find the version string, maybe the parsed Version and header."""
+        # Dict-like headers, including WSGI environs and webob's headers,
+        # are read in place. Only the wanted headers in a list of headers
+        # are folded, checking the limits as each value is added.
+        limited = self._limited
+        if type(headers) is not dict and not isinstance(headers, Mapping):
+            headers = _fold_wanted_headers(
+                headers,
+                self._wanted_headers,
+                self.max_header_length,
+                self.max_entries,
+            )
+            limited = False
+
+        header = _find_header_value(headers, _STANDARD_HEADER_NAMES)
+        if header is not None:
+            if limited:
+                self._check_limits(STANDARD_HEADER, header)
+            version_string, version = _standard_version(
+                header, self.service_type, cache, stats
+            )
+            if version_string:
+                return version_string, version, STANDARD_HEADER, header
+
+        for header_names in self._legacy_header_names:
+            value = _find_header_value(headers, header_names)
+            if value is not None:
+                if limited:
+                    self._check_limits(header_names[0], value)
+                return _legacy_version(value), None, header_names[0], value
+
+        return None, None, None, None
+
+    def _check_limits(self, header_name: str, value: str) -> None:
+        """Reject a header value which is too long or has too many entries.
+
+        :raises: HeaderTooLarge
+        """
+        _check_limits(
+            header_name, value, self.max_header_length, self.max_entries
+        )
+
+
+def _check_limits(
+    header_name: str,
+    value: str,
+    max_header_length: int | None,
+    max_entries: int | None,
+) -> None:
+    """Reject a header value which is too long or has too many entries.
+
+    :raises: HeaderTooLarge
+    """
+    if max_header_length is not None and len(value) > max_header_length:
+        raise HeaderTooLarge(
+            f'{header_name} header is longer than {max_header_length}'
+        )
+    # Counting the separators allocates nothing, unlike splitting.
+    if max_entries is not None and value.count(',') >= max_entries:
+        raise HeaderTooLarge(
+            f'{header_name} header has more than {max_entries} entries'
+        )
+
+
+class HeaderTooLarge(TypeError):
+    """A microversion header is longer, or has more entries, than allowed.
+
+    This is a ``TypeError``, as for other headers which cannot be parsed, so
+    that callers which do not distinguish it treat it as a bad request.
+    """
+
 
+def _count_found(
+    stats: 'MicroversionStats', version_string: str | None
+) -> None:
+    """Count whether a version, or latest, was found in the headers."""
+    if version_string is None:
+        stats.count('header_absent')
+    else:
+        stats.count('header_present')
+        if version_string == 'latest':
+            stats.count('latest')
+
+
+@functools.lru_cache(maxsize=64)
+def _service_lookup(
+    service_type: str, legacy_headers: tuple[str, ...] = ()
+) -> HeaderLookup:
+    """Get a shared HeaderLookup for a service and legacy headers."""
+    return HeaderLookup(service_type, legacy_headers)
+
+
+def _lookup(
+    service_type: 'str | HeaderLookup',
+    legacy_headers: Iterable[str] | None = None,
+) -> HeaderLookup:
+    """Get the HeaderLookup for a service type and legacy headers."""
+    if isinstance(service_type, HeaderLookup):
+        if legacy_headers:
+            raise TypeError(
+                'legacy_headers cannot be given with a HeaderLookup'
+            )
+        return service_type
     if legacy_headers:
-        version = check_legacy_headers(folded_headers, legacy_headers)
-        return version
+        return _service_lookup(service_type, tuple(legacy_headers))
+    return _service_lookup(service_type)
 
-    return None
+
+def _standard_version(
+    header: str,
+    service_type: str,
+    cache: 'HeaderCache | None',
+    stats: 'MicroversionStats | None' = None,
+) -> tuple[str | None, 'Version | None']:
+    """Get the version for service from a standard header, maybe cached."""
+    if cache is not None:
+        if stats is not None and cache._contains((header, service_type)):
+            stats.count('cache_hit')
+        return cache.get(header, service_type)
+    return _service_version(header, service_type), None
+
+
+def get_versions(
+    headers: Headers,
+    max_header_length: int | None = None,
+    max_entries: int | None = None,
+) -> dict[str, str]:
+    """Parse the microversions of all services out of headers.
+
+    Only the standard ``openstack-api-version`` header is used. As for
+    :func:`get_version`, if a service is listed more than once the last
+    version wins.
+
+    :param headers: The headers of a request, dict or list
+    :param max_header_length: The length of the longest header accepted,
+        or None for no limit.
+    :param max_entries: The largest number of comma separated entries
+        accepted in the header, or None for no limit.
+    :returns: A dict of version strings, or "latest", keyed by lowercased
+        service type.
+    :raises: HeaderTooLarge if the header is beyond the limits, before it is
+        split.
+    """
+    limited = max_header_length is not None or max_entries is not None
+    if type(headers) is not dict and not isinstance(headers, Mapping):
+        headers = _fold_wanted_headers(
+            headers, _STANDARD_WANTED_HEADERS, max_header_length, max_entries
+        )
+        limited = False
+    header = _find_header_value(headers, _STANDARD_HEADER_NAMES)
+    if header is None:
+        return {}
+    if limited:
+        _check_limits(STANDARD_HEADER, header, max_header_length, max_entries)
+    versions = {}
+    for header_value in header.split(','):
+        try:
+            service, version = header_value.strip().split(None, 1)
+        except ValueError:
+            continue
+        versions[service.lower()] = version.strip()
+    return versions
 
 
 def check_legacy_headers(
@@ -107,7 +486,7 @@ def check_legacy_headers(
     for legacy_header in legacy_headers:
         try:
             value = _extract_header_value(headers, legacy_header.lower())
-            return value.split(',')[-1].strip()
+            return _legacy_version(value)
         except KeyError:
             pass
     return None
@@ -119,16 +498,43 @@ def check_standard_header(
     """Parse the standard header to get value for service."""
     try:
         header = _extract_header_value(headers, STANDARD_HEADER)
-        for header_value in reversed(header.split(',')):
-            try:
-                service, version = header_value.strip().split(None, 1)
-                if service.lower() == service_type.lower():
-                    return version.strip()
-            except ValueError:
-                pass
-    except (KeyError, ValueError):
+    except KeyError:
         return None
+    return _service_version(header, service_type)
+
+
+def _legacy_version(header: str) -> str:
+    """Get the version from the value of a legacy header."""
+    return header.split(',')[-1].strip()
+
 
+def _service_version(header: str | None, service_type: str) -> str | None:
+    """Get the version for service from the value of the standard header.
+
+    The entries in the header are scanned from the last to the first, as
+    the last entry for a service wins, stopping at the first match. Entries
+    are only split when they start with the service type.
+    """
+    if header is None:
+        return None
+    service_type = service_type.lower()
+    # Most headers name a single service.
+    if ',' not in header:
+        fields = header.split(None, 1)
+        if len(fields) == 2 and fields[0].lower() == service_type:
+            return fields[1].strip()
+        return None
+    service_type_length = len(service_type)
+    end = len(header)
+    while end >= 0:
+        start = header.rfind(',', 0, end) + 1
+        entry = header[start:end].strip()
+        if (
+            entry[service_type_length : service_type_length + 1].isspace()
+            and entry[:service_type_length].lower() == service_type
+        ):
+            return entry[service_type_length:].strip()
+        end = start - 1
     return None
 
 
@@ -154,6 +560,103 @@ def fold_headers(headers: Any) -> MutableMapping[str, str]:
     return folded_headers
 
 
+def _wanted_headers(
+    wanted_header_names: Iterable[tuple[str, str, str]],
+) -> tuple[dict[str | bytes, str], frozenset[int]]:
+    """Prepare the header names wanted by :func:`_fold_wanted_headers`.
+
+    :param wanted_header_names: The forms of the wanted header names, from
+        :func:`_header_names`.
+    :returns: A dict mapping each lowercased header name and lowercased WSGI
+        environ form of the name, as str and bytes, to the str form, and the
+        set of the lengths of those names.
+    """
+    wanted: dict[str | bytes, str] = {}
+    for header_name, _, wsgi_lower_header_name in wanted_header_names:
+        for name in (header_name, wsgi_lower_header_name):
+            wanted[name] = name
+            wanted[name.encode('latin-1')] = name
+    return wanted, frozenset(len(name) for name in wanted)
+
+
+def _fold_wanted_headers(
+    headers: _SupportsItems
+    | Iterable[tuple[str, str]]
+    | Iterable[tuple[bytes, bytes]],
+    wanted_headers: tuple[dict[str | bytes, str], frozenset[int]],
+    max_header_length: int | None = None,
+    max_entries: int | None = None,
+) -> dict[str, str]:
+    """Fold only the wanted headers from a list of headers into a dict.
+
+    Header names and values may be str or, as provided by many servers,
+    bytes. Only the names of headers which are the same length as a wanted
+    header are lowercased and only the values of wanted headers are decoded.
+
+    :param headers: A list of header name and value tuples, or an object
+        which is not a dict but has an ``items`` method that returns them.
+    :param wanted_headers: The wanted header names, from
+        :func:`_wanted_headers`.
+    :param max_header_length: The length of the longest folded header
+        accepted, or None for no limit.
+    :param max_entries: The largest number of comma separated entries
+        accepted in a folded header, or None for no limit.
+    :returns: A dict of folded headers, keyed by the lowercased header name
+        or lowercased WSGI environ form of the header name.
+    :raises: HeaderTooLarge as soon as a wanted header is beyond the limits,
+        before the rest of the headers are folded.
+    """
+    # Objects which are not dicts, but behave like them, such as
+    # http.client.HTTPMessage, give their headers with items().
+    items: Iterable[tuple[Any, Any]]
+    get_items = (
+        None if type(headers) is list else getattr(headers, 'items', None)
+    )
+    if get_items is not None:
+        items = get_items()
+    else:
+        items = headers  # type: ignore[assignment]
+
+    wanted, wanted_lengths = wanted_headers
+    limited = max_header_length is not None or max_entries is not None
+    # The length and number of entries of each header folded so far.
+    lengths: dict[str, int] = {}
+    entries: dict[str, int] = {}
+    header_dict: dict[str, list[str]] = {}
+    for header, value in items:
+        if len(header) not in wanted_lengths:
+            continue
+        wanted_name = wanted.get(header) or wanted.get(header.lower())
+        if wanted_name is None:
+            continue
+        if isinstance(value, bytes):
+            value = value.decode('latin-1')
+        value = value.strip()
+        if limited:
+            # Each value after the first is joined with a comma.
+            length = lengths.get(wanted_name, -1) + 1 + len(value)
+            if max_header_length is not None and length > max_header_length:
+                raise HeaderTooLarge(
+                    f'{wanted_name} header is longer than {max_header_length}'
+                )
+            lengths[wanted_name] = length
+            if max_entries is not None:
+                count = entries.get(wanted_name, 0) + value.count(',') + 1
+                if count > max_entries:
+                    raise HeaderTooLarge(
+                        f'{wanted_name} header has more than {max_entries} '
+                        'entries'
+                    )
+                entries[wanted_name] = count
+        values = header_dict.get(wanted_name)
+        if values is None:
+            header_dict[wanted_name] = [value]
+        else:
+            values.append(value)
+
+    return {header: ','.join(value) for header, value in header_dict.items()}
+
+
 def headers_from_wsgi_environ(
     environ: MutableMapping[str, str],
 ) -> dict[str, str]:
@@ -162,11 +665,77 @@ def headers_from_wsgi_environ(
     Note that this does not change the keys in any way in the returned dict.
     Nor is the incoming environ modified.
 
+    Use :class:`WSGIEnvironHeaders` for a view of the headers that does not
+    copy them.
+
     :param environ: A PEP 3333 compliant WSGI environ dict.
     """
     return {key: environ[key] for key in environ if key.startswith('HTTP_')}
 
 
+class WSGIEnvironHeaders(Mapping[str, str]):
+    """A read-only view of the headers in a WSGI environ.
+
+    Unlike :func:`headers_from_wsgi_environ` nothing is copied: header names
+    are translated to the ``HTTP_`` keys of the environ when they are looked
+    up, so ``view['OpenStack-API-Version']`` reads
+    ``environ['HTTP_OPENSTACK_API_VERSION']``. As in PEP 3333, the
+    ``Content-Type`` and ``Content-Length`` headers are read from
+    ``CONTENT_TYPE`` and ``CONTENT_LENGTH``, without the prefix. Iterating
+    the view yields lowercased header names such as
+    ``openstack-api-version``.
+
+    :param environ: A PEP 3333 compliant WSGI environ dict.
+    """
+
+    __slots__ = ('environ',)
+
+    def __init__(self, environ: Mapping[str, Any]) -> None:
+        self.environ = environ
+
+    def __getitem__(self, header_name: str) -> str:
+        value = self.environ.get(_environ_key(header_name))
+        if value is None:
+            raise KeyError(header_name)
+        return value  # type: ignore[no-any-return]
+
+    def __contains__(self, header_name: object) -> bool:
+        if not isinstance(header_name, str):
+            return False
+        return _environ_key(header_name) in self.environ
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.environ:
+            if key in _UNPREFIXED_ENVIRON_KEYS:
+                yield _UNPREFIXED_ENVIRON_KEYS[key]
+            elif (
+                key.startswith('HTTP_')
+                and key[5:] not in _UNPREFIXED_ENVIRON_KEYS
+            ):
+                yield key[5:].replace('_', '-').lower()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({dict(self)!r})'
+
+
+# The headers which PEP 3333 puts in the environ without the HTTP_ prefix.
+_UNPREFIXED_ENVIRON_KEYS = {
+    'CONTENT_TYPE': 'content-type',
+    'CONTENT_LENGTH': 'content-length',
+}
+
+
+def _environ_key(header_name: str) -> str:
+    """Get the WSGI environ key of a header name."""
+    key = header_name.upper().replace('-', '_')
+    if key in _UNPREFIXED_ENVIRON_KEYS:
+        return key
+    return 'HTTP_' + key
+
+
 def _extract_header_value(
     headers: MutableMapping[str, str], header_name: str
 ) -> str:
@@ -187,28 +756,256 @@ def _extract_header_value(
     return value
 
 
-def parse_version_string(version_string: str) -> Version:
+def _header_names(header_name: str) -> tuple[str, str, str]:
+    """Get the forms in which a header name may be used as a key.
+
+    These are the lowercased header name, the PEP 3333 WSGI environ key and
+    the lowercased WSGI environ key that :func:`fold_headers` produces from
+    a WSGI environ.
+    """
+    header_name = header_name.lower()
+    wsgi_header_name = ENVIRON_HTTP_HEADER_FMT.format(
+        header_name.replace('-', '_')
+    )
+    return header_name, wsgi_header_name.upper(), wsgi_header_name
+
+
+_STANDARD_HEADER_NAMES = _header_names(STANDARD_HEADER)
+_VARY_HEADER = ('vary', STANDARD_HEADER)
+_STANDARD_WANTED_HEADERS = _wanted_headers([_STANDARD_HEADER_NAMES])
+
+
+def _find_header_value(
+    headers: Mapping[str, str], header_names: tuple[str, str, str]
+) -> str | None:
+    """Get the value of one header without folding all the headers.
+
+    ``headers`` may be a WSGI environ, webob's ``EnvironHeaders`` or any
+    other dict-like collection of headers, as long as keys that differ from
+    the forms in ``header_names`` only by case are not repeated. As when
+    the headers were folded, a key matching the header name takes
+    precedence over the WSGI environ form of the name.
+
+    :param headers: The dict-like headers of a request
+    :param header_names: The forms of the header name, from
+        :func:`_header_names`
+    :returns: The header value or None if the header is not present.
+    """
+    header_name, wsgi_header_name, wsgi_lower_header_name = header_names
+
+    if type(headers) is not dict:
+        if isinstance(headers, WSGIEnvironHeaders):
+            return headers.environ.get(wsgi_header_name)
+        # webob's EnvironHeaders is a view over a WSGI environ. Reading the
+        # environ directly avoids translating every key when iterating.
+        environ = getattr(headers, 'environ', None)
+        if isinstance(environ, dict):
+            return environ.get(wsgi_header_name)
+    # A PEP 3333 environ only ever uses the canonical form of the key.
+    if 'wsgi.version' in headers:
+        return headers.get(wsgi_header_name)
+
+    value = headers.get(header_name)
+    if value is not None:
+        return value
+    value = headers.get(wsgi_header_name)
+    if value is None:
+        value = headers.get(wsgi_lower_header_name)
+
+    # Fall back to comparing keys without regard to case, only lowercasing
+    # those keys which could possibly match.
+    name_length = len(header_name)
+    wsgi_name_length = len(wsgi_header_name)
+    for key in headers:
+        key_length = len(key)
+        if key_length == name_length and key.lower() == header_name:
+            return headers[key]
+        if (
+            value is None
+            and key_length == wsgi_name_length
+            and key.lower() == wsgi_lower_header_name
+        ):
+            value = headers[key]
+    return value
+
+
+def parse_version_string(version_string: str | bytes) -> Version:
     """Turn a version string into a Version
 
-    :param version_string: A string of two numerals, X.Y.
+    :param version_string: A string of two numerals, X.Y. Raw bytes, as
+        read from headers, are parsed without being decoded.
     :returns: a Version
     :raises: TypeError
     """
+    version = try_parse_version_string(version_string)
+    if version is not None:
+        return version
+
+    # Only invalid version strings, or the rare valid ones with signs or
+    # underscores, get this far: find out why, or parse them, with int.
+    values: list[str] | list[bytes]
     try:
+        if isinstance(version_string, bytes):
+            values = version_string.split(b'.', 1)
+        else:
+            values = version_string.split('.', 1)
         # The combination of int and a limited split with the
-        # named tuple means that this incantation will raise
+        # Version constructor means that this incantation will raise
         # ValueError, TypeError or AttributeError when the incoming
         # data is poorly formed but will, however, naturally adapt to
         # extraneous whitespace.
-        return Version(*(int(value) for value in version_string.split('.', 1)))
+        return Version(*(int(value) for value in values))
     except (ValueError, TypeError, AttributeError) as exc:
+        if isinstance(version_string, bytes):
+            version_string = version_string.decode('latin-1')
         raise TypeError(f'invalid version string: {version_string}; {exc}')
 
 
+def try_parse_version_string(version_string: str | bytes) -> Version | None:
+    """Turn a version string into a Version, or None if it is not valid.
+
+    This accepts the same version strings as :func:`parse_version_string`
+    but checks their form before converting them, rather than relying on
+    exceptions, so that rejecting the garbage sent by broken clients is
+    cheap.
+
+    :param version_string: A string of two numerals, X.Y. Raw bytes, as
+        read from headers, are parsed without being decoded.
+    :returns: a Version, or None if ``version_string`` is not valid.
+    """
+    parts: tuple[str, str, str] | tuple[bytes, bytes, bytes]
+    if isinstance(version_string, str):
+        parts = version_string.partition('.')
+    elif isinstance(version_string, bytes):
+        parts = version_string.partition(b'.')
+    else:
+        return None
+    major, dot, minor = parts
+    if not dot:
+        return None
+    major_value = _parse_int(major)
+    if major_value is None:
+        return None
+    minor_value = _parse_int(minor)
+    if minor_value is None:
+        return None
+    return Version(major_value, minor_value)
+
+
+def _invalid_version_string(version_string: str) -> TypeError:
+    """Make the error for a version string that is not valid.
+
+    This is for version strings already rejected by
+    :func:`try_parse_version_string`, and describes the problem as
+    :func:`parse_version_string` does without converting them again.
+    """
+    major, dot, minor = version_string.partition('.')
+    if _parse_int(major) is None:
+        reason = f'invalid literal for int() with base 10: {major!r}'
+    elif not dot:
+        # The message of the TypeError from Version(major).
+        reason = (
+            "Version.__new__() missing 1 required positional argument: 'minor'"
+        )
+    else:
+        reason = f'invalid literal for int() with base 10: {minor!r}'
+    return TypeError(f'invalid version string: {version_string}; {reason}')
+
+
+def _parse_int(value: str | bytes) -> int | None:
+    """Convert a numeral as int would, or return None if int would fail."""
+    # The common case, plain ASCII digits.
+    if value.isdigit() and value.isascii():
+        return int(value)
+    # Otherwise int allows surrounding whitespace, a sign and, for str, any
+    # decimal digits.
+    if isinstance(value, str):
+        stripped = value.strip()
+        digits = stripped.lstrip('+-')
+        valid = digits.isdecimal()
+        underscored = '_' in digits
+        signs = len(stripped) - len(digits)
+    else:
+        raw_stripped = value.strip()
+        raw_digits = raw_stripped.lstrip(b'+-')
+        valid = raw_digits.isdigit()
+        underscored = b'_' in raw_digits
+        signs = len(raw_stripped) - len(raw_digits)
+    # Underscores may also separate digits. Leave the finer points of
+    # these rare cases to int.
+    if (valid and signs <= 1) or underscored:
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return None
+
+
+def encode_version(version: 'VersionTuple | str') -> int:
+    """Encode a version as an integer.
+
+    The major version is held in the high bits and the minor version in the
+    low 16 bits, so encoded versions compare in the same order as versions
+    and take much less space than a :class:`~Version` or a version string,
+    for example when recording the versions of many requests.
+
+    :param version: A :class:`~Version`, tuple or version string.
+    :returns: ``major << 16 | minor``
+    :raises: ValueError if either part is negative or the minor version does
+        not fit in 16 bits.
+    """
+    if isinstance(version, str):
+        version = parse_version_string(version)
+    major, minor = version
+    if major < 0 or not 0 <= minor <= _MINOR_MASK:
+        raise ValueError(f'version {major}.{minor} cannot be encoded')
+    return major << 16 | minor
+
+
+def decode_version(encoded: int) -> Version:
+    """Decode a version encoded by :func:`encode_version`.
+
+    :param encoded: The encoded version.
+    :returns: a Version
+    """
+    return Version(encoded >> 16, encoded & _MINOR_MASK)
+
+
+def encode_versions(
+    versions: 'Iterable[VersionTuple | str] | VersionSet',
+) -> 'array.array[int]':
+    """Encode versions into a compact array.
+
+    An array of encoded versions is sorted when the versions are, and can
+    then be searched with :mod:`bisect`.
+
+    :param versions: :class:`~Version` objects, tuples or version strings,
+        or a :class:`~VersionSet`.
+    :returns: An ``array.array`` of unsigned 64 bit integers.
+    """
+    return array.array('Q', map(encode_version, versions))
+
+
+def decode_versions(encoded: Iterable[int]) -> list[Version]:
+    """Decode versions encoded by :func:`encode_version`.
+
+    :param encoded: The encoded versions, such as an array from
+        :func:`encode_versions`.
+    :returns: a list of Versions
+    """
+    return [decode_version(value) for value in encoded]
+
+
+_MINOR_MASK = 0xFFFF
+
+
 def extract_version(
-    headers: Iterable[tuple[str, str]] | MutableMapping[str, str],
-    service_type: str,
-    versions_list: Sequence[str],
+    headers: 'Headers',
+    service_type: 'str | HeaderLookup',
+    versions_list: 'Sequence[str] | VersionSet',
+    cache: 'HeaderCache | None' = None,
+    stats: 'MicroversionStats | None' = None,
+    legacy_headers: Iterable[str] | None = None,
 ) -> Version:
     """Extract the microversion from the headers.
 
@@ -218,14 +1015,51 @@ def extract_version(
     version.
 
     :param headers: Request headers as dict list or WSGI environ
-    :param service_type: The service type as a string
+    :param service_type: The service type as a string, or a
+        :class:`~HeaderLookup` for the service type and legacy headers
     :param versions_list: List of all possible microversions as strings,
-        sorted from earliest to latest version.
+        sorted from earliest to latest version, or a :class:`~VersionSet`
+        built from such a list.
+    :param cache: An optional :class:`~HeaderCache` in which to remember
+        the result of parsing the standard header
+    :param stats: An optional :class:`~MicroversionStats` in which to
+        record what was found and how long it took
+    :param legacy_headers: Other headers to look at for a version, as for
+        :func:`get_version`
     :returns: a :class:`~Version` with the optional ``min_version`` and
         ``max_version`` attributes set.
     :raises: ValueError
     """
-    found_version = get_version(headers, service_type=service_type)
+    lookup = _lookup(service_type, legacy_headers)
+    if isinstance(versions_list, VersionSet):
+        return versions_list.extract(headers, lookup, cache=cache, stats=stats)
+    if stats is not None:
+        return _instrumented(
+            stats,
+            _extract_version,
+            headers,
+            lookup,
+            versions_list,
+            cache,
+            stats,
+        )
+    return _extract_version(headers, lookup, versions_list, cache)
+
+
+def _extract_version(
+    headers: 'Headers',
+    lookup: 'HeaderLookup',
+    versions_list: Sequence[str],
+    cache: 'HeaderCache | None',
+    stats: 'MicroversionStats | None' = None,
+) -> Version:
+    """Extract the microversion from the headers, with a versions list."""
+    if stats is None:
+        found_version, cached_version, _, _ = lookup._find(
+            headers, cache, None
+        )
+    else:
+        found_version, cached_version = lookup.find(headers, cache, stats)
     min_version_string = versions_list[0]
     max_version_string = versions_list[-1]
 
@@ -234,11 +1068,1098 @@ def extract_version(
     version_string = found_version or min_version_string
     if version_string == 'latest':
         version_string = max_version_string
-    request_version = parse_version_string(version_string)
-    request_version.max_version = parse_version_string(max_version_string)
-    request_version.min_version = parse_version_string(min_version_string)
+    if cached_version is not None:
+        request_version = cached_version
+    else:
+        parsed_version = try_parse_version_string(version_string)
+        if parsed_version is None:
+            raise _invalid_version_string(version_string)
+        request_version = parsed_version
+    max_version = parse_version_string(max_version_string)
+    min_version = parse_version_string(min_version_string)
     # We need a version that is in versions_list. This gives us the option
     # to administratively disable a version if we really need to.
     if str(request_version) in versions_list:
-        return request_version
+        return Version(
+            request_version.major,
+            request_version.minor,
+            min_version=min_version,
+            max_version=max_version,
+        )
     raise ValueError(f'Unacceptable version header: {version_string}')
+
+
+def _compile_version(version_string: str) -> Version:
+    """Parse an entry of a versions list, requiring its canonical form."""
+    version = parse_version_string(version_string)
+    if str(version) != version_string:
+        raise ValueError(
+            f'version {version_string!r} in versions_list should be '
+            f'written as {str(version)!r}'
+        )
+    return version
+
+
+def _is_gap(previous: Version, version: Version) -> bool:
+    """Whether versions are missing between two adjacent, ordered versions.
+
+    A new major version may start at any minor version.
+    """
+    if previous.major == version.major:
+        return version.minor != previous.minor + 1
+    return version.major != previous.major + 1
+
+
+class VersionSet:
+    """An ordered set of the microversions supported by a service.
+
+    A ``VersionSet`` is intended to be built once, when an application
+    starts, from the same ordered list of version strings that would
+    otherwise be passed to :func:`extract_version` on every request. The
+    minimum and maximum versions are parsed up front and the allowed
+    versions are held in a hashed set, so validating a requested version
+    does not require scanning or re-parsing the list. The list itself is
+    checked when the set is built.
+    """
+
+    def __init__(
+        self, versions_list: Sequence[str], allow_gaps: bool = True
+    ) -> None:
+        """Create the set of versions.
+
+        Every entry is parsed and checked here, once, so that a badly
+        formed list fails when the application starts rather than on
+        some later request.
+
+        :param versions_list: List of all possible microversions as strings,
+            sorted from earliest to latest version.
+        :param allow_gaps: If ``False``, raise ``ValueError`` if a version
+            is missing from the middle of ``versions_list``. Gaps are
+            always recorded in :attr:`gaps`.
+        :raises: ValueError if ``versions_list`` is empty, is not in
+            increasing order, contains the same version twice or contains
+            a version that is not written in its canonical form (``1.05``
+            rather than ``1.5``).
+        :raises: TypeError if an entry in ``versions_list`` is not a valid
+            version string.
+        """
+        if not versions_list:
+            raise ValueError('versions_list must not be empty')
+        self.versions_list = tuple(versions_list)
+        versions = [_compile_version(v) for v in self.versions_list]
+        gaps = []
+        for previous, version in zip(versions, versions[1:]):
+            if version == previous:
+                raise ValueError(
+                    f'versions_list contains version {version} more than once'
+                )
+            if version < previous:
+                raise ValueError(
+                    f'versions_list is not in increasing order: '
+                    f'{version} follows {previous}'
+                )
+            if _is_gap(previous, version):
+                gaps.append((previous, version))
+        #: Pairs of adjacent versions in ``versions_list`` with one or more
+        #: versions missing between them.
+        self.gaps: tuple[tuple[Version, Version], ...] = tuple(gaps)
+        if gaps and not allow_gaps:
+            raise ValueError(
+                'versions_list has gaps between '
+                + ', '.join(f'{low} and {high}' for low, high in gaps)
+            )
+        self.min_version = versions[0]
+        self.max_version = versions[-1]
+        # Each allowed version is interned, with min_version and max_version
+        # set, so that every request for a version gets the same object.
+        self._versions: dict[VersionTuple, Version] = {
+            version: version._replace(
+                min_version=self.min_version, max_version=self.max_version
+            )
+            for version in versions
+        }
+        # The response headers for each version, made for each service type
+        # the first time it is negotiated.
+        self._response_headers: dict[
+            str, dict[VersionTuple, tuple[tuple[str, str], ...]]
+        ] = {}
+
+    def __contains__(self, version: object) -> bool:
+        return version in self._versions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.versions_list)
+
+    def __len__(self) -> int:
+        return len(self.versions_list)
+
+    def extract(
+        self,
+        headers: 'Headers',
+        service_type: 'str | HeaderLookup',
+        cache: 'HeaderCache | None' = None,
+        stats: 'MicroversionStats | None' = None,
+    ) -> Version:
+        """Extract the microversion from the headers.
+
+        This behaves as :func:`extract_version` called with the versions
+        list used to create this set.
+
+        :param headers: Request headers as dict list or WSGI environ
+        :param service_type: The service type as a string, or a
+            :class:`~HeaderLookup` for the service type and legacy headers
+        :param cache: An optional :class:`~HeaderCache` in which to remember
+            the result of parsing the standard header
+        :param stats: An optional :class:`~MicroversionStats` in which to
+            record what was found and how long it took
+        :returns: a :class:`~Version` with the ``min_version`` and
+            ``max_version`` attributes set.
+        :raises: ValueError, TypeError
+        """
+        if stats is not None:
+            return _instrumented(
+                stats, self._extract, headers, service_type, cache, stats
+            )
+        return self._select(*_lookup(service_type).find(headers, cache))
+
+    def _extract(
+        self,
+        headers: 'Headers',
+        service_type: 'str | HeaderLookup',
+        cache: 'HeaderCache | None',
+        stats: 'MicroversionStats',
+    ) -> Version:
+        """Extract the microversion from the headers, counting in stats."""
+        return self._select(*_lookup(service_type).find(headers, cache, stats))
+
+    def negotiate(
+        self,
+        headers: 'Headers',
+        service_type: 'str | HeaderLookup',
+        cache: 'HeaderCache | None' = None,
+        stats: 'MicroversionStats | None' = None,
+    ) -> 'Negotiation':
+        """Negotiate the microversion of a request.
+
+        This extracts the microversion as :meth:`extract` does, but returns
+        a :class:`~Negotiation` with what the rest of the request needs to
+        know about how the version was chosen, and the response headers.
+
+        :param headers: Request headers as dict list or WSGI environ
+        :param service_type: The service type as a string, or a
+            :class:`~HeaderLookup` for the service type and legacy headers
+        :param cache: An optional :class:`~HeaderCache` in which to remember
+            the result of parsing the standard header
+        :param stats: An optional :class:`~MicroversionStats` in which to
+            record what was found and how long it took
+        :returns: a :class:`~Negotiation`
+        :raises: ValueError, TypeError
+        """
+        if stats is not None:
+            return _instrumented(
+                stats, self._negotiate, headers, service_type, cache, stats
+            )
+        return self._negotiate(headers, service_type, cache, None)
+
+    def _negotiate(
+        self,
+        headers: 'Headers',
+        service_type: 'str | HeaderLookup',
+        cache: 'HeaderCache | None',
+        stats: 'MicroversionStats | None',
+    ) -> 'Negotiation':
+        """Negotiate the microversion of a request, maybe counting in stats."""
+        lookup = _lookup(service_type)
+        version_string, cached_version, header_name, header_value = (
+            lookup.find_header(headers, cache, stats)
+        )
+        return self._negotiation(
+            version_string,
+            cached_version,
+            lookup.service_type,
+            header_name,
+            header_value,
+        )
+
+    def negotiate_version(
+        self,
+        version_string: str | None,
+        service_type: str,
+        header: str | None = None,
+    ) -> 'Negotiation':
+        """Negotiate a version string already found in the standard header.
+
+        This is :meth:`select` for callers, such as servers hosting several
+        services which find the versions of all of them with
+        :func:`get_versions`, that want a :class:`~Negotiation`.
+
+        :param version_string: The requested version, ``latest``, or None if
+            no version was requested, in which case the minimum version is
+            chosen.
+        :param service_type: The service type as a string
+        :param header: The value of the ``openstack-api-version`` header the
+            version string was found in.
+        :returns: a :class:`~Negotiation`
+        :raises: ValueError, TypeError
+        """
+        if version_string is None:
+            return self._negotiation(None, None, service_type, None, None)
+        return self._negotiation(
+            version_string, None, service_type, STANDARD_HEADER, header
+        )
+
+    def _negotiation(
+        self,
+        version_string: str | None,
+        cached_version: Version | None,
+        service_type: str,
+        header_name: str | None,
+        header_value: str | None,
+    ) -> 'Negotiation':
+        """Make the Negotiation for a found version string."""
+        version = self._select(version_string, cached_version)
+        if version_string is None:
+            source = Negotiation.DEFAULT
+        elif version_string == 'latest':
+            source = Negotiation.LATEST
+        else:
+            source = Negotiation.HEADER
+        response_headers = self._response_headers.get(service_type)
+        return Negotiation(
+            version,
+            source,
+            header_name,
+            header_value,
+            response_headers[version]
+            if response_headers is not None
+            else self.response_headers(version, service_type),
+        )
+
+    def response_headers(
+        self, version: VersionTuple, service_type: str
+    ) -> tuple[tuple[str, str], ...]:
+        """Get the response headers for a version of a service.
+
+        The headers are made once for each version, the first time they are
+        wanted for a service type, and then shared.
+
+        :param version: A version in this set.
+        :param service_type: The service type as a string
+        :returns: The ``openstack-api-version`` and ``vary`` response
+            headers, as name and value tuples, as in
+            :attr:`Negotiation.response_headers`.
+        :raises: KeyError if the version is not in this set.
+        """
+        response_headers = self._response_headers.get(service_type)
+        if response_headers is None:
+            response_headers = {
+                version: (
+                    (STANDARD_HEADER, f'{service_type} {version}'),
+                    _VARY_HEADER,
+                )
+                for version in self._versions.values()
+            }
+            self._response_headers[service_type] = response_headers
+        return response_headers[version]
+
+    def extract_header(
+        self,
+        header: str | None,
+        service_type: str,
+        cache: 'HeaderCache | None' = None,
+    ) -> Version:
+        """Extract the microversion from the standard header value.
+
+        This is for callers, such as servers which do not use WSGI, which
+        have already found the value of the ``openstack-api-version`` header
+        themselves.
+
+        :param header: The value of the ``openstack-api-version`` header or
+            None if there is no such header.
+        :param service_type: The service type as a string
+        :param cache: An optional :class:`~HeaderCache` in which to remember
+            the result of parsing the header
+        :returns: a :class:`~Version` with the ``min_version`` and
+            ``max_version`` attributes set.
+        :raises: ValueError, TypeError
+        """
+        if header is None:
+            return self._select(None, None)
+        return self._select(*_standard_version(header, service_type, cache))
+
+    def select(self, version_string: str | None) -> Version:
+        """Choose the allowed Version for a requested version string.
+
+        :param version_string: The requested version, ``latest``, or None if
+            no version was requested, in which case the minimum version is
+            chosen.
+        :returns: a :class:`~Version` with the ``min_version`` and
+            ``max_version`` attributes set.
+        :raises: ValueError, TypeError
+        """
+        return self._select(version_string, None)
+
+    def _select(
+        self, version_string: str | None, cached_version: Version | None
+    ) -> Version:
+        """Choose the allowed Version for a found version string."""
+        if version_string is None:
+            # If there was no version found in the headers, choose the
+            # minimum available version.
+            version_string = self.versions_list[0]
+            request_version = self.min_version
+        elif version_string == 'latest':
+            version_string = self.versions_list[-1]
+            request_version = self.max_version
+        elif cached_version is not None:
+            request_version = cached_version
+        else:
+            parsed_version = try_parse_version_string(version_string)
+            if parsed_version is None:
+                raise _invalid_version_string(version_string)
+            request_version = parsed_version
+
+        version = self._versions.get(request_version)
+        if version is None:
+            raise ValueError(f'Unacceptable version header: {version_string}')
+        return version
+
+
+class Negotiation:
+    """The result of negotiating the microversion of a request.
+
+    This is made once per request, by :meth:`VersionSet.negotiate` or the
+    middleware, so that later layers need not work any of it out again.
+
+    :ivar version: The negotiated :class:`~Version`, with ``min_version``
+        and ``max_version`` set.
+    :ivar source: Where the version came from: ``header`` if a version was
+        requested, ``latest`` if ``latest`` was requested or ``default`` if
+        no version was requested, so the minimum version is used.
+    :ivar header_name: The lowercased name of the header the version was
+        found in, or None.
+    :ivar header_value: The value of that header, or None.
+    :ivar response_headers: The ``openstack-api-version`` and ``vary``
+        response headers, as name and value tuples.
+    """
+
+    DEFAULT = 'default'
+    HEADER = 'header'
+    LATEST = 'latest'
+
+    __slots__ = (
+        'version',
+        'source',
+        'header_name',
+        'header_value',
+        'response_headers',
+    )
+
+    def __init__(
+        self,
+        version: Version,
+        source: str,
+        header_name: str | None,
+        header_value: str | None,
+        response_headers: tuple[tuple[str, str], ...],
+    ) -> None:
+        self.version = version
+        self.source = source
+        self.header_name = header_name
+        self.header_value = header_value
+        self.response_headers = response_headers
+
+    def __repr__(self) -> str:
+        return (
+            f'{self.__class__.__name__}(version={self.version}, '
+            f'source={self.source!r}, header_name={self.header_name!r}, '
+            f'header_value={self.header_value!r})'
+        )
+
+    @property
+    def latest(self) -> bool:
+        """Whether the latest version was requested."""
+        return self.source == self.LATEST
+
+    @property
+    def version_header(self) -> tuple[str, str]:
+        """The ``openstack-api-version`` response header."""
+        return self.response_headers[0]
+
+
+class VersionRangeIndex(Generic[_T]):
+    """An index of values, such as handlers or schemas, by version range.
+
+    Applications often choose a code path or schema by checking the
+    negotiated version against many ranges with :meth:`Version.matches`.
+    A ``VersionRangeIndex`` is built once from ``(min_version, max_version,
+    value)`` entries and finds the values whose range includes a version
+    with a binary search, or, for the versions of a :class:`~VersionSet`
+    given when it is built, with a single dict lookup.
+
+    A ``min_version`` or ``max_version`` of None leaves that end of the
+    range open. Versions may be given as :class:`~Version` objects, tuples
+    or version strings.
+    """
+
+    def __init__(
+        self,
+        entries: Iterable[
+            tuple['VersionTuple | str | None', 'VersionTuple | str | None', _T]
+        ],
+        versions: 'VersionSet | Sequence[str] | None' = None,
+    ) -> None:
+        """Create the index.
+
+        :param entries: The ``(min_version, max_version, value)`` entries,
+            in the order their values should be returned.
+        :param versions: The versions for which to precompute the values,
+            as a :class:`~VersionSet` or list of version strings.
+        :raises: ValueError if an entry's ``min_version`` is greater than its
+            ``max_version``.
+        """
+        ranges: list[tuple[tuple[int, int], tuple[int, int], _T]] = []
+        boundaries = {_NO_VERSION}
+        for min_version, max_version, value in entries:
+            start = _range_bound(min_version, _NO_VERSION)
+            end = _range_bound(max_version, _MAX_VERSION)
+            if start > end:
+                raise ValueError(
+                    f'min_version {min_version} is greater than '
+                    f'max_version {max_version}'
+                )
+            # Versions have integer parts, so the range ends just before
+            # the next minor version.
+            stop = (end[0], end[1] + 1)
+            boundaries.update((start, stop))
+            ranges.append((start, stop, value))
+
+        # The values for the versions from each boundary up to the next.
+        self._boundaries = sorted(boundaries)
+        self._values = [
+            tuple(
+                value
+                for start, stop, value in ranges
+                if start <= boundary < stop
+            )
+            for boundary in self._boundaries
+        ]
+        self._table: dict[VersionTuple, tuple[_T, ...]] = {}
+        for version_string in versions or ():
+            version = parse_version_string(version_string)
+            self._table[version] = self._search(version)
+
+    def __getitem__(self, version: 'VersionTuple | str') -> tuple[_T, ...]:
+        return self.lookup(version)
+
+    def lookup(self, version: 'VersionTuple | str') -> tuple[_T, ...]:
+        """Get the values whose version range includes a version.
+
+        :param version: The version, usually a negotiated :class:`~Version`.
+        :returns: A tuple of the values, in the order of their entries.
+        """
+        if isinstance(version, str):
+            version = parse_version_string(version)
+        values = self._table.get(version)
+        if values is None:
+            values = self._search(version)
+        return values
+
+    def first(
+        self, version: 'VersionTuple | str', default: _T | None = None
+    ) -> _T | None:
+        """Get the first value whose version range includes a version.
+
+        :param version: The version, usually a negotiated :class:`~Version`.
+        :param default: The value to return if no range includes the
+            version.
+        """
+        values = self.lookup(version)
+        return values[0] if values else default
+
+    def _search(self, version: tuple[int, int]) -> tuple[_T, ...]:
+        """Find the values for a version with a binary search."""
+        return self._values[bisect.bisect_right(self._boundaries, version) - 1]
+
+
+_MAX_VERSION = (sys.maxsize, sys.maxsize - 1)
+
+
+def _range_bound(
+    version: 'VersionTuple | str | None', default: tuple[int, int]
+) -> tuple[int, int]:
+    """Get one end of a version range as a plain tuple."""
+    if version is None:
+        return default
+    if isinstance(version, str):
+        version = parse_version_string(version)
+    major, minor = version
+    return major, minor
+
+
+class VersionDispatcher:
+    """Dispatch to the handler registered for a microversion.
+
+    Handler variants are registered, with the :meth:`register` decorator,
+    for a range of versions. When the dispatcher is finalized, every
+    version in the versions list is mapped to its handler, so dispatching
+    a request is a single dict lookup. Finalizing checks that exactly one
+    handler is registered for each version, so overlapping ranges and gaps
+    between them are found when the application starts::
+
+        show = VersionDispatcher(['1.0', '1.1', '1.2'])
+
+
+        @show.register(max_version='1.1')
+        def show_v1_0(req): ...
+
+
+        @show.register(min_version='1.2')
+        def show_v1_2(req): ...
+
+
+        show.finalize()
+        response = show(req.environ['cats.microversion'], req)
+    """
+
+    def __init__(self, versions: 'VersionSet | Sequence[str]') -> None:
+        """Create the dispatcher.
+
+        :param versions: The versions to dispatch, as a :class:`~VersionSet`
+            or an ordered list of version strings.
+        """
+        if isinstance(versions, VersionSet):
+            self.version_set = versions
+        else:
+            self.version_set = VersionSet(versions)
+        self._entries: list[
+            tuple[VersionTuple | str | None, VersionTuple | str | None, Any]
+        ] = []
+        self._table: dict[VersionTuple, Callable[..., Any]] | None = None
+
+    def register(
+        self,
+        min_version: 'VersionTuple | str | None' = None,
+        max_version: 'VersionTuple | str | None' = None,
+    ) -> Callable[[_F], _F]:
+        """Register the decorated function as the handler for versions.
+
+        :param min_version: The earliest version handled, or None for the
+            minimum version.
+        :param max_version: The latest version handled, or None for the
+            maximum version.
+        :returns: A decorator which registers and returns the function.
+        :raises: TypeError if the dispatcher has been finalized.
+        """
+        if self._table is not None:
+            raise TypeError('Handlers cannot be registered once finalized')
+
+        def decorator(handler: _F) -> _F:
+            self._entries.append((min_version, max_version, handler))
+            return handler
+
+        return decorator
+
+    def finalize(self) -> None:
+        """Map every version to its handler.
+
+        This is done when the first request is dispatched, but should be
+        done once all the handlers are registered, as the application
+        starts, to find mistakes in the version ranges.
+
+        :raises: ValueError if any version has no handler, or more than one.
+        """
+        index = VersionRangeIndex(self._entries)
+        table: dict[VersionTuple, Callable[..., Any]] = {}
+        for version_string in self.version_set:
+            version = self.version_set.select(version_string)
+            handlers = index.lookup(version)
+            if not handlers:
+                raise ValueError(f'No handler for version {version}')
+            if len(handlers) > 1:
+                names = ', '.join(
+                    getattr(handler, '__qualname__', repr(handler))
+                    for handler in handlers
+                )
+                raise ValueError(
+                    f'More than one handler for version {version}: {names}'
+                )
+            table[version] = handlers[0]
+        self._table = table
+
+    def handler(self, version: VersionTuple) -> Callable[..., Any]:
+        """Get the handler for a version.
+
+        :param version: The negotiated version.
+        :raises: ValueError if the version is not in the versions list.
+        """
+        table = self._table
+        if table is None:
+            self.finalize()
+            table = self._table
+            assert table is not None
+        try:
+            return table[version]
+        except KeyError:
+            raise ValueError(f'Unacceptable version: {version}') from None
+
+    def __call__(
+        self, version: VersionTuple, *args: Any, **kwargs: Any
+    ) -> Any:
+        """Call the handler for a version with the remaining arguments."""
+        return self.handler(version)(*args, **kwargs)
+
+
+class MicroversionStats:
+    """Counters and timings of microversion negotiation.
+
+    A ``MicroversionStats`` may be passed to :func:`get_version`,
+    :func:`extract_version`, :meth:`VersionSet.extract` and the middleware
+    to find out how often each path is taken and how long it takes. Nothing
+    is recorded, at no more cost than checking for ``None``, when no stats
+    are passed.
+
+    The ``counters`` dict counts these events:
+
+    * ``header_present``: a version, or ``latest``, was found in the headers
+    * ``header_absent``: no version was found in the headers
+    * ``latest``: the version found was ``latest``
+    * ``cache_hit``: the standard header was found in a :class:`HeaderCache`
+    * ``invalid``: the version found could not be parsed, which the
+      middleware turns into a 400 response
+    * ``unacceptable``: the version found is not allowed, which the
+      middleware turns into a 406 response
+    * ``too_large``: a microversion header was beyond the limits of a
+      :class:`HeaderLookup`, which the middleware turns into a 431 response
+
+    The ``timings`` dict holds a histogram of durations, in seconds, for
+    ``parse``, the time taken to find and parse a version, and
+    ``middleware``, the time the middleware takes before calling the
+    application. Each histogram is a list of the number of durations no
+    longer than the matching entry of ``buckets``, with a final entry for
+    longer durations.
+
+    To export to a metrics system as events happen, subclass and extend
+    :meth:`count` and :meth:`observe`. Like the counters of
+    :class:`HeaderCache` these are updated without a lock, so may
+    undercount slightly when shared by many threads.
+    """
+
+    events = (
+        'header_present',
+        'header_absent',
+        'latest',
+        'cache_hit',
+        'invalid',
+        'unacceptable',
+        'too_large',
+    )
+    timers = ('parse', 'middleware')
+    default_buckets = (
+        0.000_001,
+        0.000_002_5,
+        0.000_005,
+        0.000_01,
+        0.000_025,
+        0.000_05,
+        0.000_1,
+        0.000_25,
+        0.000_5,
+        0.001,
+    )
+
+    def __init__(self, buckets: Iterable[float] | None = None) -> None:
+        """Create the stats.
+
+        :param buckets: The upper bounds, in seconds, of the histogram
+                        buckets. Defaults to ``default_buckets``.
+        """
+        if buckets is None:
+            buckets = self.default_buckets
+        self.buckets = tuple(sorted(buckets))
+        self.counters: dict[str, int] = {}
+        self.timings: dict[str, list[int]] = {}
+        self.timing_sums: dict[str, float] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset all the counters and timings to zero."""
+        self.counters = dict.fromkeys(self.events, 0)
+        self.timings = {
+            timer: [0] * (len(self.buckets) + 1) for timer in self.timers
+        }
+        self.timing_sums = dict.fromkeys(self.timers, 0.0)
+
+    def count(self, event: str) -> None:
+        """Count an event.
+
+        :param event: One of ``events``.
+        """
+        self.counters[event] += 1
+
+    def observe(self, timer: str, seconds: float) -> None:
+        """Record a duration.
+
+        :param timer: One of ``timers``.
+        :param seconds: The duration.
+        """
+        self.timings[timer][bisect.bisect_left(self.buckets, seconds)] += 1
+        self.timing_sums[timer] += seconds
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get a copy of the counters and timings.
+
+        :returns: A dict of the count of each event, and for each timer a
+            dict of its ``buckets`` as a list of (upper bound, count)
+            tuples, the upper bound of the last being ``inf``, its total
+            ``count`` and the ``sum`` of its durations.
+        """
+        snapshot: dict[str, Any] = dict(self.counters)
+        bounds = (*self.buckets, float('inf'))
+        for timer in self.timers:
+            counts = list(self.timings[timer])
+            snapshot[timer] = {
+                'buckets': list(zip(bounds, counts)),
+                'count': sum(counts),
+                'sum': self.timing_sums[timer],
+            }
+        return snapshot
+
+
+def _instrumented(
+    stats: MicroversionStats,
+    extract: Callable[..., _T],
+    *args: Any,
+) -> _T:
+    """Call an extract function, recording its errors and timing in stats."""
+    start = time.perf_counter()
+    try:
+        return extract(*args)
+    except ValueError:
+        stats.count('unacceptable')
+        raise
+    except HeaderTooLarge:
+        stats.count('too_large')
+        raise
+    except TypeError:
+        stats.count('invalid')
+        raise
+    finally:
+        stats.observe('parse', time.perf_counter() - start)
+
+
+class VersionCounter:
+    """Counts of the requests made at each microversion.
+
+    To decide when a microversion may be deprecated, or to plan for the
+    load at each, the middleware may be given a ``VersionCounter`` to count
+    each request by its negotiated :class:`~Version`.
+
+    Counts are kept in a fixed number of shards, each a dict with its own
+    lock. Each thread, or eventlet greenthread, is given a shard the first
+    time it counts, in turn, so counting from many threads rarely contends
+    and loses no counts, and however many short-lived threads count, the
+    counts take no more room. The shards are added together when the counts
+    are read.
+    """
+
+    #: The number of shards the counts are kept in.
+    shards = 16
+
+    def __init__(
+        self, versions: 'Iterable[VersionTuple | str] | VersionSet' = ()
+    ) -> None:
+        """Create the counter.
+
+        :param versions: Versions to count from zero, so that versions
+                         which are never requested are also reported,
+                         as a :class:`~VersionSet` or an iterable of version
+                         strings or tuples.
+        """
+        self._versions: list[Version] = []
+        for version in versions:
+            if isinstance(version, str):
+                version = parse_version_string(version)
+            self._versions.append(Version(*version))
+        self._shards: list[tuple[dict[VersionTuple, int], threading.Lock]] = [
+            ({}, threading.Lock()) for _ in range(self.shards)
+        ]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+
+    def count(self, version: VersionTuple) -> None:
+        """Count a request made at a version.
+
+        :param version: The negotiated version.
+        """
+        try:
+            counts, lock = self._local.shard
+        except AttributeError:
+            shard = next(self._next_shard) % self.shards
+            counts, lock = self._local.shard = self._shards[shard]
+        with lock:
+            counts[version] = counts.get(version, 0) + 1
+
+    def reset(self) -> None:
+        """Set the count of every version back to zero."""
+        for counts, lock in self._shards:
+            with lock:
+                counts.clear()
+
+    def snapshot(self) -> dict[str, int]:
+        """Get the count of each version.
+
+        :returns: A dict of the count of requests keyed by version string,
+            in version order.
+        """
+        totals: dict[VersionTuple, int] = dict.fromkeys(self._versions, 0)
+        for counts, lock in self._shards:
+            with lock:
+                shard_counts = list(counts.items())
+            for version, count in shard_counts:
+                totals[version] = totals.get(version, 0) + count
+        return {
+            str(Version(*version)): count
+            for version, count in sorted(totals.items())
+        }
+
+
+class HeaderCache:
+    """A bounded cache of parsed ``openstack-api-version`` header values.
+
+    Clients tend to send the same few header values over and over again, so
+    the result of finding the version for a service in a header value, and
+    of parsing that version, can be remembered and reused. Entries are keyed
+    on the raw header value and the service type and the least recently used
+    entry is evicted once ``maxsize`` entries are held.
+
+    To keep clients sending arbitrary header values from pushing out the
+    useful entries, only header values no longer than ``max_header_length``
+    which contain a valid version, or ``latest``, for the service are cached,
+    and only once the same header value has been seen twice. A flood of
+    distinct header values is remembered only in a bounded set of values
+    seen once, which is emptied when it fills, and evicts nothing. Entries
+    added by :meth:`warm` are never evicted.
+
+    The ``hits``, ``misses`` and ``evictions`` counters may be inspected to
+    judge how effective the cache is.
+
+    A cache may be shared by many threads. Hits take no lock; only adding
+    and evicting entries does. Under a preforking server a cache may be
+    filled with :meth:`warm` before the workers are forked, so that each
+    inherits the entries. In each new worker the lock is replaced, in case
+    another thread held it when the worker was forked, and the counters are
+    reset so that they count that worker's requests.
+    """
+
+    def __init__(
+        self, maxsize: int = 128, max_header_length: int = 256
+    ) -> None:
+        """Create the cache.
+
+        :param maxsize: The maximum number of entries to hold.
+        :param max_header_length: The length of the longest header value
+                                  which will be cached.
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.max_header_length = max_header_length
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: collections.OrderedDict[
+            tuple[str, str], tuple[str, Version | None]
+        ] = collections.OrderedDict()
+        # Entries added by warm(), which are not evicted.
+        self._warm_entries: dict[
+            tuple[str, str], tuple[str, Version | None]
+        ] = {}
+        # The keys of cacheable header values seen once.
+        self._seen: set[tuple[str, str]] = set()
+        self._lock = threading.Lock()
+        self.pid = os.getpid()
+        _header_caches.add(self)
+
+    def __len__(self) -> int:
+        return len(self._warm_entries) + len(self._entries)
+
+    def _contains(self, key: tuple[str, str]) -> bool:
+        """Whether there is an entry for a header value and service type."""
+        return key in self._warm_entries or key in self._entries
+
+    def warm(
+        self,
+        service_type: str,
+        versions: 'Iterable[str] | VersionSet',
+    ) -> None:
+        """Add entries for the header values clients usually send.
+
+        An entry is added for ``SERVICE_TYPE VERSION`` for each version, and
+        for ``latest``, without being counted as a miss. These entries are
+        held in addition to ``maxsize`` other entries and are never evicted.
+
+        :param service_type: The service type of the versions.
+        :param versions: The version strings, or a :class:`~VersionSet`.
+        """
+        with self._lock:
+            for version_string in (*versions, 'latest'):
+                version = None
+                if version_string != 'latest':
+                    version = try_parse_version_string(version_string)
+                    if version is None:
+                        continue
+                key = (f'{service_type} {version_string}', service_type)
+                self._warm_entries[key] = (version_string, version)
+
+    def stats(self) -> dict[str, int]:
+        """Get the counters of this process.
+
+        :returns: A dict of the ``pid`` of the process, the ``size`` of the
+            cache and the ``hits``, ``misses`` and ``evictions`` counted
+            since the cache was created, cleared or the process was forked.
+        """
+        return {
+            'pid': self.pid,
+            'size': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _after_fork(self) -> None:
+        """Prepare the cache inherited by a new child process."""
+        self._lock = threading.Lock()
+        self.pid = os.getpid()
+        self.hits = self.misses = self.evictions = 0
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._warm_entries.clear()
+            self._seen.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def get(
+        self, header: str, service_type: str
+    ) -> tuple[str | None, Version | None]:
+        """Get the version for a service from a standard header value.
+
+        :param header: The value of the ``openstack-api-version`` header.
+        :param service_type: The service type being looked for in the header.
+        :returns: A tuple of the version string, or None if there is no
+            version for ``service_type``, and the parsed :class:`~Version`,
+            or None if the version string is ``latest`` or is not valid.
+        """
+        key = (header, service_type)
+        entry = self._warm_entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                # Evicted by another thread since it was read.
+                pass
+            return entry
+
+        self.misses += 1
+        version_string = _service_version(header, service_type)
+        if version_string is None:
+            return None, None
+        version = None
+        if version_string != 'latest':
+            version = try_parse_version_string(version_string)
+            if version is None:
+                return version_string, None
+        if len(header) <= self.max_header_length:
+            self._admit(key, (version_string, version))
+        return version_string, version
+
+    def _admit(
+        self, key: tuple[str, str], entry: tuple[str, Version | None]
+    ) -> None:
+        """Add an entry if its header value has been seen before."""
+        with self._lock:
+            if key not in self._seen:
+                if len(self._seen) >= self.maxsize:
+                    self._seen.clear()
+                self._seen.add(key)
+                return
+            self._seen.discard(key)
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+# Every HeaderCache, so that each can be prepared for use in a new child
+# process after a fork.
+_header_caches: 'weakref.WeakSet[HeaderCache]' = weakref.WeakSet()
+
+
+def _after_fork_in_child() -> None:
+    """Prepare every HeaderCache for use in a new child process."""
+    for cache in list(_header_caches):
+        cache._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def extract_versions(
+    headers_iterable: Iterable[Headers],
+    service_type: 'str | HeaderLookup',
+    versions_list: Sequence[str] | VersionSet,
+    cache: HeaderCache | None = None,
+) -> Iterator[Version | ValueError | TypeError]:
+    """Extract the microversions from many collections of headers.
+
+    This is for processing large numbers of requests at once, for example
+    when auditing access logs. The versions list is prepared once, and a
+    cache of parsed header values shared, across all the collections of
+    headers. Results are generated lazily, in order, so that the headers may
+    be streamed.
+
+    :param headers_iterable: An iterable of request headers, each of any form
+        accepted by :func:`extract_version`
+    :param service_type: The service type as a string, or a
+        :class:`~HeaderLookup` for the service type and legacy headers
+    :param versions_list: List of all possible microversions as strings,
+        sorted from earliest to latest version, or a :class:`~VersionSet`
+        built from such a list.
+    :param cache: A :class:`~HeaderCache` to use. If not provided, one is
+        created for the batch.
+    :returns: An iterator of a :class:`~Version` for each collection of
+        headers, or the ``ValueError`` or ``TypeError`` that
+        :func:`extract_version` would have raised for it.
+    """
+    if isinstance(versions_list, VersionSet):
+        version_set = versions_list
+    else:
+        version_set = VersionSet(versions_list)
+    if cache is None:
+        cache = HeaderCache()
+    return _extract_versions(
+        headers_iterable, service_type, version_set, cache
+    )
+
+
+def _extract_versions(
+    headers_iterable: Iterable[Headers],
+    service_type: 'str | HeaderLookup',
+    version_set: VersionSet,
+    cache: HeaderCache,
+) -> Iterator[Version | ValueError | TypeError]:
+    """Generate the results of :func:`extract_versions`."""
+    extract = version_set.extract
+    for headers in headers_iterable:
+        try:
+            yield extract(headers, service_type, cache=cache)
+        except (ValueError, TypeError) as exc:
+            yield exc
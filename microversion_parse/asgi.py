@@ -0,0 +1,221 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""ASGI middleware for getting microversion info."""
+
+import time
+from collections.abc import (
+    Awaitable,
+    Callable,
+    Iterable,
+    MutableMapping,
+    Sequence,
+)
+from typing import Any
+
+import microversion_parse
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApplication = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+STANDARD_HEADER = microversion_parse.STANDARD_HEADER.encode('latin-1')
+
+
+class MicroversionMiddleware:
+    """ASGI middleware for getting microversion info.
+
+    This is the ASGI equivalent of
+    :class:`microversion_parse.middleware.MicroversionMiddleware`. The
+    application will get an HTTP connection scope with a
+    'SERVICE_TYPE.microversion' key that has a value of the microversion
+    found at an 'openstack-api-version' header that matches SERVICE_TYPE. If
+    no header is found, the minimum microversion will be set. If the
+    special keyword 'latest' is used, the maximum microversion will be
+    set. A 'SERVICE_TYPE.microversion_negotiation' key has the
+    :class:`~microversion_parse.Negotiation` with the details of how the
+    microversion was chosen.
+
+    If the requested microversion is not available a 406 response is
+    returned.
+
+    If there is an error parsing a provided header, a 400 response is
+    returned. A header longer than ``max_header_length``, or with more
+    entries than ``max_entries``, gets a 431 response without being parsed.
+
+    Otherwise the application is called, with the microversion headers
+    added to the start of its response. Response bodies are passed through
+    untouched.
+
+    Connections other than HTTP, such as websockets and lifespan, are
+    passed straight to the application.
+    """
+
+    def __init__(
+        self,
+        application: ASGIApplication,
+        service_type: str,
+        versions: Sequence[str] | microversion_parse.VersionSet,
+        cache: microversion_parse.HeaderCache | None = None,
+        stats: microversion_parse.MicroversionStats | None = None,
+        version_counter: microversion_parse.VersionCounter | None = None,
+        legacy_headers: Iterable[str] | None = None,
+        max_header_length: int | None = None,
+        max_entries: int | None = None,
+    ) -> None:
+        """Create the ASGI middleware.
+
+        :param application: The application hosting the service.
+        :param service_type: The service type (entry in keystone catalog)
+                             of the application.
+        :param versions: An ordered list of legitimate versions for the
+                         application, or a
+                         :class:`~microversion_parse.VersionSet` built
+                         from one. A list is checked as by
+                         :class:`~microversion_parse.VersionSet`.
+        :param cache: An optional :class:`~microversion_parse.HeaderCache`
+                      in which to remember parsed header values.
+        :param stats: An optional
+                      :class:`~microversion_parse.MicroversionStats` in
+                      which to record what was found in requests and how
+                      long the middleware took.
+        :param version_counter: An optional
+                                :class:`~microversion_parse.VersionCounter`
+                                with which to count requests by their
+                                microversion.
+        :param legacy_headers: Other headers to look at for a version if
+                               there is none for the service in the
+                               'openstack-api-version' header.
+        :param max_header_length: The length of the longest microversion
+                                  header accepted. Longer headers get a 431
+                                  response without being parsed.
+        :param max_entries: The largest number of comma separated entries
+                            accepted in a microversion header. Headers with
+                            more get a 431 response without being parsed.
+        """
+        self.application = application
+        self.service_type = service_type
+        self.microversion_scope = f'{service_type}.microversion'
+        self.negotiation_scope = f'{service_type}.microversion_negotiation'
+        self.header_lookup = microversion_parse.HeaderLookup(
+            service_type,
+            legacy_headers,
+            max_header_length=max_header_length,
+            max_entries=max_entries,
+        )
+        if isinstance(versions, microversion_parse.VersionSet):
+            self.version_set = versions
+        else:
+            self.version_set = microversion_parse.VersionSet(versions)
+        self.cache = cache
+        self.stats = stats
+        self.version_counter = version_counter
+        # The response headers of each version, encoded once.
+        self._response_headers = {
+            version: tuple(
+                (name.encode('latin-1'), value.encode('latin-1'))
+                for name, value in self.version_set.response_headers(
+                    version, service_type
+                )
+            )
+            for version in map(self.version_set.select, self.version_set)
+        }
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope['type'] != 'http':
+            await self.application(scope, receive, send)
+            return
+
+        stats = self.stats
+        start = time.perf_counter() if stats is not None else 0.0
+        try:
+            negotiation = self.version_set.negotiate(
+                scope['headers'],
+                self.header_lookup,
+                cache=self.cache,
+                stats=stats,
+            )
+        except (ValueError, TypeError) as exc:
+            if stats is not None:
+                stats.observe('middleware', time.perf_counter() - start)
+            await _send_error(send, *_error(exc))
+            return
+
+        microversion = negotiation.version
+        if self.version_counter is not None:
+            self.version_counter.count(microversion)
+        # Middleware must not change the scope it was given.
+        scope = {
+            **scope,
+            self.microversion_scope: microversion,
+            self.negotiation_scope: negotiation,
+        }
+        version_header, vary_header = self._response_headers[microversion]
+        if stats is not None:
+            stats.observe('middleware', time.perf_counter() - start)
+
+        async def _send(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                response_headers = message.get('headers', ())
+                headers = [*response_headers, version_header]
+                if not _varies_on_microversion(response_headers):
+                    headers.append(vary_header)
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        await self.application(scope, receive, _send)
+
+
+def _varies_on_microversion(headers: Iterable[tuple[bytes, bytes]]) -> bool:
+    """Whether raw response headers already vary on the microversion."""
+    for name, value in headers:
+        if len(name) == 4 and name.lower() == b'vary':
+            for field in value.split(b','):
+                field = field.strip().lower()
+                if field == b'*' or field == STANDARD_HEADER:
+                    return True
+    return False
+
+
+def _error(exc: ValueError | TypeError) -> tuple[int, str]:
+    """Get the status and detail of the response to a microversion error.
+
+    As for the WSGI middleware, a ValueError, for a version which is not
+    available, is a 406. A TypeError, for a header which cannot be parsed,
+    is a 400, unless it is too large to be parsed, which is a 431.
+    """
+    if isinstance(exc, microversion_parse.HeaderTooLarge):
+        return 431, str(exc)
+    if isinstance(exc, ValueError):
+        return 406, f'Invalid microversion: {exc}'
+    return 400, f'Invalid microversion: {exc}'
+
+
+async def _send_error(send: Send, status: int, detail: str) -> None:
+    """Send a plain text error response."""
+    body = detail.encode('utf-8')
+    await send(
+        {
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'text/plain; charset=UTF-8'),
+                (b'content-length', str(len(body)).encode('latin-1')),
+            ],
+        }
+    )
+    await send({'type': 'http.response.body', 'body': body})
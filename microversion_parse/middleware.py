@@ -13,7 +13,9 @@
 
 """WSGI middleware for getting microversion info."""
 
-from collections.abc import Sequence
+import json
+import time
+from collections.abc import Mapping, Sequence
 from typing import Any, Protocol, TYPE_CHECKING
 
 import webob
@@ -23,7 +25,17 @@ import webob.exc
 import microversion_parse
 
 if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+    from _typeshed import OptExcInfo
+    from _typeshed.wsgi import StartResponse
     from _typeshed.wsgi import WSGIApplication
+    from _typeshed.wsgi import WSGIEnvironment
+
+
+_STANDARD_ENVIRON_KEY = (
+    'HTTP_' + microversion_parse.STANDARD_HEADER.upper().replace('-', '_')
+)
 
 
 class _JSONFormatter(Protocol):
@@ -40,7 +52,9 @@ class MicroversionMiddleware:
     found at an 'openstack-api-version' header that matches SERVICE_TYPE. If
     no header is found, the minimum microversion will be set. If the
     special keyword 'latest' is used, the maximum microversion will be
-    set.
+    set. A 'SERVICE_TYPE.microversion_negotiation' key has the
+    :class:`~microversion_parse.Negotiation` with the details of how the
+    microversion was chosen.
 
     If the requested microversion is not available a 406 response is
     returned.
@@ -55,8 +69,14 @@ class MicroversionMiddleware:
         self,
         application: 'WSGIApplication | None',
         service_type: str,
-        versions: Sequence[str],
+        versions: Sequence[str] | microversion_parse.VersionSet,
         json_error_formatter: _JSONFormatter | None = None,
+        cache: microversion_parse.HeaderCache | None = None,
+        stats: microversion_parse.MicroversionStats | None = None,
+        version_counter: microversion_parse.VersionCounter | None = None,
+        legacy_headers: 'Iterable[str] | None' = None,
+        max_header_length: int | None = None,
+        max_entries: int | None = None,
     ) -> None:
         """Create the WSGI middleware.
 
@@ -64,42 +84,88 @@ class MicroversionMiddleware:
         :param service_type: The service type (entry in keystone catalog)
                              of the application.
         :param versions: An ordered list of legitimate versions for the
-                         application.
+                         application, or a
+                         :class:`~microversion_parse.VersionSet` built
+                         from one. A list is checked as by
+                         :class:`~microversion_parse.VersionSet`.
         :param json_error_formatter: A Webob exception error formatter.
                                      See Webob for details.
+        :param cache: An optional :class:`~microversion_parse.HeaderCache`
+                      in which to remember parsed header values.
+        :param stats: An optional
+                      :class:`~microversion_parse.MicroversionStats` in
+                      which to record what was found in requests and how
+                      long the middleware took.
+        :param version_counter: An optional
+                                :class:`~microversion_parse.VersionCounter`
+                                with which to count requests by their
+                                microversion.
+        :param legacy_headers: Other headers to look at for a version if
+                               there is none for the service in the
+                               'openstack-api-version' header.
+        :param max_header_length: The length of the longest microversion
+                                  header accepted. Longer headers get a 431
+                                  response without being parsed.
+        :param max_entries: The largest number of comma separated entries
+                            accepted in a microversion header. Headers with
+                            more get a 431 response without being parsed.
         """
         self.application = application
         self.service_type = service_type
         self.microversion_environ = f'{service_type}.microversion'
+        self.negotiation_environ = f'{service_type}.microversion_negotiation'
+        self.header_lookup = microversion_parse.HeaderLookup(
+            service_type,
+            legacy_headers,
+            max_header_length=max_header_length,
+            max_entries=max_entries,
+        )
         self.versions = versions
+        if isinstance(versions, microversion_parse.VersionSet):
+            self.version_set = versions
+        else:
+            self.version_set = microversion_parse.VersionSet(versions)
         self.json_error_formatter = json_error_formatter
+        self.cache = cache
+        self.stats = stats
+        self.version_counter = version_counter
+
+    def _negotiate(self, headers: Any) -> microversion_parse.Negotiation:
+        """Negotiate the microversion from the request headers or environ.
+
+        :raises: webob.exc.HTTPNotAcceptable if the requested microversion
+                 is not available.
+        :raises: webob.exc.HTTPBadRequest if the header cannot be parsed.
+        """
+        try:
+            negotiation = self.version_set.negotiate(
+                headers, self.header_lookup, cache=self.cache, stats=self.stats
+            )
+        except (ValueError, TypeError) as exc:
+            raise _http_error(exc, self.json_error_formatter)
+        if self.version_counter is not None:
+            self.version_counter.count(negotiation.version)
+        return negotiation
 
     @webob.dec.wsgify
     def __call__(
         self,
         req: webob.request.Request,
     ) -> webob.response.Response | None:
+        stats = self.stats
+        start = time.perf_counter() if stats is not None else 0.0
         try:
-            microversion = microversion_parse.extract_version(
-                req.headers, self.service_type, self.versions
-            )
-        # TODO(cdent): These error response are not formatted according to
-        # api-sig guidelines, unless a json_error_formatter is provided
-        # that can do it. For an example, see the placement service.
-        except ValueError as exc:
-            raise webob.exc.HTTPNotAcceptable(
-                (f'Invalid microversion: {exc}'),
-                json_formatter=self.json_error_formatter,
-            )
-        except TypeError as exc:
-            raise webob.exc.HTTPBadRequest(
-                (f'Invalid microversion: {exc}'),
-                json_formatter=self.json_error_formatter,
-            )
+            negotiation = self._negotiate(req.headers)
+        except webob.exc.HTTPError:
+            if stats is not None:
+                stats.observe('middleware', time.perf_counter() - start)
+            raise
 
-        req.environ[self.microversion_environ] = microversion
-        microversion_header = f'{self.service_type} {microversion}'
-        standard_header = microversion_parse.STANDARD_HEADER
+        req.environ[self.microversion_environ] = negotiation.version
+        req.environ[self.negotiation_environ] = negotiation
+        version_header, vary_header = negotiation.response_headers
+        if stats is not None:
+            stats.observe('middleware', time.perf_counter() - start)
 
         try:
             response = req.get_response(self.application)
@@ -107,9 +173,278 @@ class MicroversionMiddleware:
             # If there was an HTTPError in the application we still need
             # to send the microversion header, so add the header and
             # re-raise the exception.
-            exc.headers.add(standard_header, microversion_header)
+            exc.headerlist.append(version_header)
             raise exc
 
-        response.headers.add(standard_header, microversion_header)
-        response.headers.add('vary', standard_header)
+        headerlist = response.headerlist
+        headerlist.append(version_header)
+        if not _varies_on_microversion(headerlist):
+            headerlist.append(vary_header)
         return response
+
+
+class FastMicroversionMiddleware(MicroversionMiddleware):
+    """WSGI middleware for getting microversion info, without webob requests.
+
+    This behaves as :class:`MicroversionMiddleware`, but works directly with
+    the PEP 3333 WSGI environ and ``start_response`` rather than creating a
+    webob request and response for every request. The microversion headers
+    are added to those passed to ``start_response`` by the application and
+    the response body is passed through untouched, so streamed responses
+    remain streamed. Webob is only used to make the 400 and 406 responses.
+    """
+
+    def __call__(  # type: ignore[override]
+        self,
+        environ: 'WSGIEnvironment',
+        start_response: 'StartResponse',
+    ) -> 'Iterable[bytes]':
+        stats = self.stats
+        start = time.perf_counter() if stats is not None else 0.0
+        try:
+            negotiation = self._negotiate(environ)
+        except webob.exc.HTTPError as exc:
+            if stats is not None:
+                stats.observe('middleware', time.perf_counter() - start)
+            return exc(environ, start_response)
+
+        environ[self.microversion_environ] = negotiation.version
+        environ[self.negotiation_environ] = negotiation
+        version_header, vary_header = negotiation.response_headers
+        if stats is not None:
+            stats.observe('middleware', time.perf_counter() - start)
+
+        assert self.application is not None
+        return _call_application(
+            self.application,
+            environ,
+            start_response,
+            (version_header,),
+            vary_header,
+        )
+
+
+class MultiServiceMicroversionMiddleware:
+    """WSGI middleware for getting microversion info for several services.
+
+    This behaves as a stack of :class:`FastMicroversionMiddleware`, one for
+    each of several service types hosted by the same application, but the
+    'openstack-api-version' header is only found and parsed once per request
+    however many services there are.
+
+    The application will get a WSGI environ with a
+    'SERVICE_TYPE.microversion' key and a
+    'SERVICE_TYPE.microversion_negotiation' key for each service type, and
+    a 'openstack.microversions' key with a dict of all of the microversions
+    keyed by service type. A response header with the microversion of each
+    service is returned.
+
+    As the 'openstack-api-version' header is shared by all the services,
+    only it is used: there are no legacy headers, and no cache, stats or
+    version counter. Use a stack of :class:`FastMicroversionMiddleware` for
+    those.
+
+    If the requested microversion of any service is not available a 406
+    response is returned.
+
+    If there is an error parsing a provided header, a 400 response is
+    returned. A header longer than ``max_header_length``, or with more
+    entries than ``max_entries``, gets a 431 response without being parsed.
+
+    Otherwise the application is called.
+    """
+
+    microversions_environ = 'openstack.microversions'
+
+    def __init__(
+        self,
+        application: 'WSGIApplication',
+        services: Mapping[str, Sequence[str] | microversion_parse.VersionSet],
+        json_error_formatter: _JSONFormatter | None = None,
+        max_header_length: int | None = None,
+        max_entries: int | None = None,
+    ) -> None:
+        """Create the WSGI middleware.
+
+        :param application: The application hosting the services.
+        :param services: A dict of the service types (entries in keystone
+                         catalog) of the application, each with an ordered
+                         list of its legitimate versions or a
+                         :class:`~microversion_parse.VersionSet`.
+        :param json_error_formatter: A Webob exception error formatter.
+                                     See Webob for details.
+        :param max_header_length: The length of the longest
+                                  'openstack-api-version' header accepted.
+        :param max_entries: The largest number of comma separated entries
+                            accepted in the 'openstack-api-version' header.
+        """
+        self.application = application
+        self.max_header_length = max_header_length
+        self.max_entries = max_entries
+        self.version_sets = {
+            service_type: (
+                versions
+                if isinstance(versions, microversion_parse.VersionSet)
+                else microversion_parse.VersionSet(versions)
+            )
+            for service_type, versions in services.items()
+        }
+        self.json_error_formatter = json_error_formatter
+
+    def __call__(
+        self,
+        environ: 'WSGIEnvironment',
+        start_response: 'StartResponse',
+    ) -> 'Iterable[bytes]':
+        header = environ.get(_STANDARD_ENVIRON_KEY)
+        negotiations = {}
+        try:
+            requested_versions = microversion_parse.get_versions(
+                environ, self.max_header_length, self.max_entries
+            )
+            for service_type, version_set in self.version_sets.items():
+                negotiations[service_type] = version_set.negotiate_version(
+                    requested_versions.get(service_type.lower()),
+                    service_type,
+                    header,
+                )
+        except (ValueError, TypeError) as exc:
+            error = _http_error(exc, self.json_error_formatter)
+            return error(environ, start_response)
+
+        microversions = {}
+        version_headers = []
+        vary_header = None
+        for service_type, negotiation in negotiations.items():
+            microversions[service_type] = negotiation.version
+            environ[f'{service_type}.microversion'] = negotiation.version
+            environ[f'{service_type}.microversion_negotiation'] = negotiation
+            version_header, vary_header = negotiation.response_headers
+            version_headers.append(version_header)
+        environ[self.microversions_environ] = microversions
+
+        return _call_application(
+            self.application,
+            environ,
+            start_response,
+            version_headers,
+            vary_header,
+        )
+
+
+class VersionCountsApplication:
+    """WSGI application reporting the requests made at each microversion.
+
+    Responds to every request with a JSON object of the snapshot of each
+    :class:`~microversion_parse.VersionCounter`, keyed by service type,
+    for example ``{"cats": {"1.0": 12, "1.1": 250}}``. Mount it at a path
+    which only operators can reach.
+    """
+
+    def __init__(
+        self, counters: Mapping[str, microversion_parse.VersionCounter]
+    ) -> None:
+        """Create the WSGI application.
+
+        :param counters: The version counters, keyed by service type.
+        """
+        self.counters = counters
+
+    def __call__(
+        self,
+        environ: 'WSGIEnvironment',
+        start_response: 'StartResponse',
+    ) -> 'Iterable[bytes]':
+        body = json.dumps(
+            {
+                service_type: counter.snapshot()
+                for service_type, counter in self.counters.items()
+            }
+        ).encode('utf-8')
+        start_response(
+            '200 OK',
+            [
+                ('content-type', 'application/json'),
+                ('content-length', str(len(body))),
+            ],
+        )
+        return [body]
+
+
+def _http_error(
+    exc: ValueError | TypeError,
+    json_error_formatter: _JSONFormatter | None,
+) -> webob.exc.HTTPError:
+    """Make the error response for a microversion which cannot be used.
+
+    A ValueError, for a version which is not available, is a 406. A
+    TypeError, for a header which cannot be parsed, is a 400, unless it is
+    too large to be parsed, which is a 431.
+    """
+    # TODO(cdent): These error response are not formatted according to
+    # api-sig guidelines, unless a json_error_formatter is provided
+    # that can do it. For an example, see the placement service.
+    if isinstance(exc, microversion_parse.HeaderTooLarge):
+        return webob.exc.HTTPRequestHeaderFieldsTooLarge(
+            str(exc), json_formatter=json_error_formatter
+        )
+    if isinstance(exc, ValueError):
+        return webob.exc.HTTPNotAcceptable(
+            (f'Invalid microversion: {exc}'),
+            json_formatter=json_error_formatter,
+        )
+    return webob.exc.HTTPBadRequest(
+        (f'Invalid microversion: {exc}'),
+        json_formatter=json_error_formatter,
+    )
+
+
+def _varies_on_microversion(headers: 'Iterable[tuple[str, str]]') -> bool:
+    """Whether response headers already vary on the microversion header."""
+    for name, value in headers:
+        if len(name) == 4 and name.lower() == 'vary':
+            for field in value.split(','):
+                field = field.strip().lower()
+                if field == '*' or field == microversion_parse.STANDARD_HEADER:
+                    return True
+    return False
+
+
+def _call_application(
+    application: 'WSGIApplication',
+    environ: 'WSGIEnvironment',
+    start_response: 'StartResponse',
+    version_headers: Sequence[tuple[str, str]],
+    vary_header: tuple[str, str] | None,
+) -> 'Iterable[bytes]':
+    """Call a WSGI application, adding microversion headers to its response.
+
+    The version headers are added to the response, or to a webob HTTPError
+    raised by the application, which is used as the response. The vary
+    header is also added to the response, unless the application already
+    varies on the microversion header.
+
+    :param version_headers: The microversion headers to add to the response.
+    :param vary_header: The vary header to add to the response, if any.
+    """
+
+    def _start_response(
+        status: str,
+        response_headers: list[tuple[str, str]],
+        exc_info: 'OptExcInfo | None' = None,
+    ) -> 'Callable[[bytes], object]':
+        headers = [*response_headers, *version_headers]
+        if vary_header is not None and not _varies_on_microversion(
+            response_headers
+        ):
+            headers.append(vary_header)
+        return start_response(status, headers, exc_info)
+
+    try:
+        return application(environ, _start_response)
+    except webob.exc.HTTPError as exc:
+        # If there was an HTTPError in the application we still need
+        # to send the microversion header, so add the header and
+        # respond with the exception.
+        exc.headerlist.extend(version_headers)
+        return exc(environ, start_response)
@@ -0,0 +1,193 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+from typing import Any
+
+import testtools
+
+import microversion_parse
+from microversion_parse import asgi
+
+SERVICE_TYPE = 'cats'
+VERSIONS = ['1.0', '1.1', '1.2']
+
+
+class SimpleASGI:
+    """An ASGI application which records the scope it was called with."""
+
+    def __init__(self, headers=()):
+        self.scope: Any = None
+        self.headers = [(b'content-type', b'text/plain'), *headers]
+
+    async def __call__(self, scope, receive, send):
+        self.scope = scope
+        await send(
+            {
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': self.headers,
+            }
+        )
+        await send(
+            {'type': 'http.response.body', 'body': b'one', 'more_body': True}
+        )
+        await send({'type': 'http.response.body', 'body': b'two'})
+
+
+class TestASGIMicroversionMiddleware(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.application = SimpleASGI()
+        self.middleware = asgi.MicroversionMiddleware(
+            self.application, SERVICE_TYPE, VERSIONS
+        )
+
+    def _make_middleware(self, **kwargs):
+        self.middleware = asgi.MicroversionMiddleware(
+            self.application, SERVICE_TYPE, VERSIONS, **kwargs
+        )
+
+    def _call(self, headers, scope_type='http'):
+        scope = {'type': scope_type, 'headers': headers}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.middleware(scope, receive, send))
+        return scope, messages
+
+    def test_min_default(self):
+        scope, messages = self._call([(b'accept', b'text/plain')])
+        self.assertEqual((1, 0), self.application.scope['cats.microversion'])
+        self.assertNotIn('cats.microversion', scope)
+        headers = messages[0]['headers']
+        self.assertIn((b'openstack-api-version', b'cats 1.0'), headers)
+        self.assertIn((b'vary', b'openstack-api-version'), headers)
+        self.assertIn((b'content-type', b'text/plain'), headers)
+
+    def test_response_headers_shared(self):
+        scope, messages = self._call([(b'openstack-api-version', b'cats 1.1')])
+        first_headers = messages[0]['headers']
+        scope, messages = self._call([(b'openstack-api-version', b'cats 1.1')])
+        self.assertIs(first_headers[-2], messages[0]['headers'][-2])
+
+    def test_vary_not_repeated(self):
+        for vary in (b'Accept, OpenStack-API-Version', b'*'):
+            self.application.headers = [(b'Vary', vary)]
+            scope, messages = self._call([])
+            headers = messages[0]['headers']
+            self.assertEqual(
+                [(b'Vary', vary)],
+                [header for header in headers if header[0].lower() == b'vary'],
+            )
+            self.assertIn((b'openstack-api-version', b'cats 1.0'), headers)
+
+    def test_negotiation(self):
+        self._call([(b'openstack-api-version', b'cats latest')])
+        negotiation = self.application.scope['cats.microversion_negotiation']
+        self.assertEqual((1, 2), negotiation.version)
+        self.assertIs(
+            negotiation.version, self.application.scope['cats.microversion']
+        )
+        self.assertTrue(negotiation.latest)
+        self.assertEqual('openstack-api-version', negotiation.header_name)
+        self.assertEqual('cats latest', negotiation.header_value)
+
+    def test_legacy_headers(self):
+        self._make_middleware(legacy_headers=['x-openstack-cats-version'])
+        self._call([(b'x-openstack-cats-version', b'1.1')])
+        negotiation = self.application.scope['cats.microversion_negotiation']
+        self.assertEqual((1, 1), negotiation.version)
+        self.assertEqual('x-openstack-cats-version', negotiation.header_name)
+
+    def test_stats_and_counter(self):
+        stats = microversion_parse.MicroversionStats()
+        counter = microversion_parse.VersionCounter(VERSIONS)
+        self._make_middleware(stats=stats, version_counter=counter)
+        self._call([(b'openstack-api-version', b'cats 1.1')])
+        self._call([(b'openstack-api-version', b'cats 1.9')])
+        snapshot = stats.snapshot()
+        self.assertEqual(2, snapshot['header_present'])
+        self.assertEqual(1, snapshot['unacceptable'])
+        self.assertEqual(2, snapshot['middleware']['count'])
+        self.assertEqual({'1.0': 0, '1.1': 1, '1.2': 0}, counter.snapshot())
+
+    def test_latest(self):
+        scope, messages = self._call(
+            [(b'openstack-api-version', b'cats latest')]
+        )
+        self.assertEqual((1, 2), self.application.scope['cats.microversion'])
+        self.assertIn(
+            (b'openstack-api-version', b'cats 1.2'), messages[0]['headers']
+        )
+
+    def test_multiple_headers(self):
+        self._call(
+            [
+                (b'openstack-api-version', b'cats 1.1'),
+                (b'openstack-api-version', b' dogs 1.9 '),
+            ]
+        )
+        self.assertEqual((1, 1), self.application.scope['cats.microversion'])
+
+    def test_body_passed_through(self):
+        scope, messages = self._call([])
+        self.assertEqual(
+            [b'one', b'two'], [message['body'] for message in messages[1:]]
+        )
+        self.assertTrue(messages[1]['more_body'])
+
+    def test_out_of_range(self):
+        scope, messages = self._call([(b'openstack-api-version', b'cats 1.9')])
+        self.assertIsNone(self.application.scope)
+        self.assertEqual(406, messages[0]['status'])
+        self.assertIn(b'Unacceptable version header', messages[1]['body'])
+
+    def test_invalid_format(self):
+        scope, messages = self._call(
+            [(b'openstack-api-version', b'cats 1.9.5')]
+        )
+        self.assertIsNone(self.application.scope)
+        self.assertEqual(400, messages[0]['status'])
+        self.assertIn(b'invalid literal', messages[1]['body'])
+
+    def test_not_http(self):
+        scope, messages = self._call([], scope_type='websocket')
+        self.assertIs(scope, self.application.scope)
+        self.assertNotIn('cats.microversion', scope)
+
+    def test_header_too_large(self):
+        self._make_middleware(max_header_length=32, max_entries=3)
+        for headers in (
+            [(b'openstack-api-version', b'x' * 30 + b' 1.0, cats 1.1')],
+            [
+                (b'openstack-api-version', b'a 1.0, b 1.0'),
+                (b'openstack-api-version', b'c 1.0, cats 1.1'),
+            ],
+        ):
+            self.application.scope = None
+            scope, messages = self._call(headers)
+            self.assertIsNone(self.application.scope)
+            self.assertEqual(431, messages[0]['status'])
+            self.assertIn(b'openstack-api-version header', messages[1]['body'])
+
+    def test_header_within_limits(self):
+        self._make_middleware(max_header_length=32, max_entries=3)
+        self._call([(b'openstack-api-version', b'a 1.0, b 1.0, cats 1.1')])
+        self.assertEqual((1, 1), self.application.scope['cats.microversion'])
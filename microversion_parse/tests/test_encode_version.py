@@ -0,0 +1,65 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import array
+import bisect
+
+import testtools
+
+import microversion_parse
+
+
+class TestEncodeVersion(testtools.TestCase):
+    def test_round_trip(self):
+        for version in ((0, 0), (1, 5), (2, 90), (10, 65535), (70000, 1)):
+            encoded = microversion_parse.encode_version(version)
+            self.assertIsInstance(encoded, int)
+            decoded = microversion_parse.decode_version(encoded)
+            self.assertIsInstance(decoded, microversion_parse.Version)
+            self.assertEqual(version, decoded)
+
+    def test_encode(self):
+        self.assertEqual(0x0002005A, microversion_parse.encode_version('2.90'))
+        version = microversion_parse.Version(1, 5)
+        self.assertEqual(
+            0x00010005, microversion_parse.encode_version(version)
+        )
+
+    def test_order_preserved(self):
+        versions = [(1, 0), (1, 9), (1, 10), (2, 0), (2, 1), (10, 0)]
+        encoded = [microversion_parse.encode_version(v) for v in versions]
+        self.assertEqual(sorted(encoded), encoded)
+        self.assertEqual(len(set(encoded)), len(encoded))
+
+    def test_not_encodable(self):
+        for version in ((1, 65536), (-1, 0), (1, -1)):
+            self.assertRaises(
+                ValueError, microversion_parse.encode_version, version
+            )
+
+    def test_encode_versions(self):
+        version_set = microversion_parse.VersionSet(['1.0', '1.1', '1.10'])
+        encoded = microversion_parse.encode_versions(version_set)
+        self.assertIsInstance(encoded, array.array)
+        self.assertEqual([0x10000, 0x10001, 0x1000A], list(encoded))
+        self.assertEqual(
+            2,
+            bisect.bisect_left(
+                encoded, microversion_parse.encode_version((1, 10))
+            ),
+        )
+        self.assertEqual(
+            [(1, 0), (1, 1), (1, 10)],
+            microversion_parse.decode_versions(encoded),
+        )
@@ -11,6 +11,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import pickle
+import random
 
 import testtools
 
@@ -47,11 +50,11 @@ class TestVersion(testtools.TestCase):
 
     def test_version_zero_can_match(self):
         """If a version is '0.0' we want to it be able to match."""
-        version = microversion_parse.Version(0, 0)
         min_version = microversion_parse.Version(0, 0)
         max_version = microversion_parse.Version(0, 0)
-        version.min_version = min_version
-        version.max_version = max_version
+        version = microversion_parse.Version(
+            0, 0, min_version=min_version, max_version=max_version
+        )
 
         self.assertTrue(version.matches())
 
@@ -66,6 +69,36 @@ class TestVersion(testtools.TestCase):
     def test_version_init_failure(self):
         self.assertRaises(TypeError, microversion_parse.Version, 1, 2, 3)
 
+    def test_version_is_immutable(self):
+        self.assertRaises(
+            AttributeError, setattr, self.version, 'max_version', (1, 9)
+        )
+        self.assertRaises(AttributeError, setattr, self.version, 'minor', 9)
+
+    def test_version_behaves_as_tuple(self):
+        major, minor = self.version
+        self.assertEqual((1, 5), (major, minor))
+        self.assertEqual(5, self.version[1])
+        self.assertEqual(hash((1, 5)), hash(self.version))
+        self.assertIn((1, 5), {self.version})
+        self.assertLess((1, 4), self.version)
+        self.assertGreater(microversion_parse.Version(1, 10), self.version)
+        self.assertIsInstance(self.version, tuple)
+        self.assertEqual('[1, 5]', json.dumps(self.version))
+
+    def test_version_replace(self):
+        version = self.version._replace(min_version=(1, 0), max_version=(1, 9))
+        self.assertEqual(self.version, version)
+        self.assertEqual((1, 0), version.min_version)
+        self.assertEqual((1, 9), version.max_version)
+        self.assertEqual((-1, 0), self.version.max_version)
+
+    def test_version_pickles(self):
+        version = self.version._replace(min_version=(1, 0), max_version=(1, 9))
+        unpickled = pickle.loads(pickle.dumps(version))
+        self.assertEqual(version, unpickled)
+        self.assertEqual((1, 9), unpickled.max_version)
+
 
 class TestParseVersionString(testtools.TestCase):
     def test_good_version(self):
@@ -174,3 +207,343 @@ class TestExtractVersion(testtools.TestCase):
             'service4',
             self.version_list,
         )
+
+
+class TestVersionSet(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.headers = [
+            ('OpenStack-API-Version', 'service1 1.2'),
+            ('OpenStack-API-Version', 'service2 1.5'),
+            ('OpenStack-API-Version', 'service3 latest'),
+            ('OpenStack-API-Version', 'service4 2.5'),
+            ('OpenStack-API-Version', 'service5 2.x'),
+        ]
+        self.version_set = microversion_parse.VersionSet(
+            ['1.1', '1.2', '1.3', '1.4', '2.1', '2.2', '2.3', '2.4']
+        )
+
+    def test_min_max(self):
+        self.assertEqual((1, 1), self.version_set.min_version)
+        self.assertEqual((2, 4), self.version_set.max_version)
+
+    def test_contains(self):
+        self.assertIn((1, 3), self.version_set)
+        self.assertIn(microversion_parse.Version(2, 1), self.version_set)
+        self.assertNotIn((1, 5), self.version_set)
+        self.assertNotIn('1.3', self.version_set)
+
+    def test_empty(self):
+        self.assertRaises(ValueError, microversion_parse.VersionSet, [])
+
+    def test_invalid_entry(self):
+        self.assertRaises(
+            TypeError, microversion_parse.VersionSet, ['1.1', 'one.two']
+        )
+
+    def test_unordered(self):
+        self.assertRaises(
+            ValueError, microversion_parse.VersionSet, ['1.1', '1.3', '1.2']
+        )
+        self.assertRaises(
+            ValueError, microversion_parse.VersionSet, ['2.1', '1.9']
+        )
+
+    def test_duplicate(self):
+        self.assertRaises(
+            ValueError, microversion_parse.VersionSet, ['1.1', '1.1']
+        )
+
+    def test_not_canonical(self):
+        for versions in (['1.1', '1.05'], ['01.1'], [' 1.1']):
+            self.assertRaises(
+                ValueError, microversion_parse.VersionSet, versions
+            )
+
+    def test_gaps(self):
+        self.assertEqual((), self.version_set.gaps)
+        version_set = microversion_parse.VersionSet(
+            ['1.0', '1.1', '1.3', '3.0']
+        )
+        self.assertEqual(
+            [((1, 1), (1, 3)), ((1, 3), (3, 0))], list(version_set.gaps)
+        )
+        self.assertNotIn((1, 2), version_set)
+
+    def test_gaps_not_allowed(self):
+        microversion_parse.VersionSet(
+            ['1.1', '1.2', '2.0', '2.1'], allow_gaps=False
+        )
+        self.assertRaises(
+            ValueError,
+            microversion_parse.VersionSet,
+            ['1.1', '1.3'],
+            allow_gaps=False,
+        )
+
+    def test_simple_extract(self):
+        version = self.version_set.extract(self.headers, 'service1')
+        self.assertEqual((1, 2), version)
+        self.assertEqual((1, 1), version.min_version)
+        self.assertEqual((2, 4), version.max_version)
+        self.assertTrue(version.matches())
+
+    def test_default_min(self):
+        version = self.version_set.extract(self.headers, 'notlisted')
+        self.assertEqual((1, 1), version)
+        self.assertTrue(version.matches())
+
+    def test_latest(self):
+        version = self.version_set.extract(self.headers, 'service3')
+        self.assertEqual((2, 4), version)
+
+    def test_version_disabled(self):
+        self.assertRaises(
+            ValueError, self.version_set.extract, self.headers, 'service2'
+        )
+
+    def test_version_out_of_range(self):
+        self.assertRaises(
+            ValueError, self.version_set.extract, self.headers, 'service4'
+        )
+
+    def test_invalid_version(self):
+        exc = self.assertRaises(
+            TypeError, self.version_set.extract, self.headers, 'service5'
+        )
+        self.assertEqual(
+            'invalid version string: 2.x; invalid literal for int() with '
+            "base 10: 'x'",
+            str(exc),
+        )
+        exc = self.assertRaises(
+            TypeError,
+            self.version_set.extract,
+            {'openstack-api-version': 'service1 1.2.3'},
+            'service1',
+        )
+        self.assertIn(
+            "invalid literal for int() with base 10: '2.3'", str(exc)
+        )
+        exc = self.assertRaises(
+            TypeError,
+            self.version_set.extract,
+            {'openstack-api-version': 'service1 12'},
+            'service1',
+        )
+        self.assertEqual(
+            'invalid version string: 12; Version.__new__() missing 1 '
+            "required positional argument: 'minor'",
+            str(exc),
+        )
+        exc = self.assertRaises(
+            TypeError,
+            self.version_set.extract,
+            {'openstack-api-version': 'service1 abc'},
+            'service1',
+        )
+        self.assertEqual(
+            'invalid version string: abc; invalid literal for int() with '
+            "base 10: 'abc'",
+            str(exc),
+        )
+
+    def test_extract_interned(self):
+        version = self.version_set.extract(self.headers, 'service1')
+        self.assertIs(
+            version, self.version_set.extract(self.headers, 'service1')
+        )
+        headers = {'openstack-api-version': 'service1 2.4'}
+        self.assertIs(
+            self.version_set.extract(headers, 'service1'),
+            self.version_set.extract(self.headers, 'service3'),
+        )
+
+    def test_extract_version_accepts_version_set(self):
+        version = microversion_parse.extract_version(
+            self.headers, 'service1', self.version_set
+        )
+        self.assertEqual((1, 2), version)
+        self.assertEqual((2, 4), version.max_version)
+
+
+class TestExtractVersions(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.version_list = ['1.1', '1.2', '1.3']
+
+    def test_batch(self):
+        headers_iterable: list[microversion_parse.Headers] = [
+            {'openstack-api-version': 'service1 1.2'},
+            [('OpenStack-API-Version', 'service1 latest')],
+            {},
+            {'openstack-api-version': 'service1 1.9'},
+            [(b'openstack-api-version', b'service1 1.x')],
+            {'openstack-api-version': 'service1 1.2'},
+        ]
+        results = list(
+            microversion_parse.extract_versions(
+                headers_iterable, 'service1', self.version_list
+            )
+        )
+        self.assertEqual(6, len(results))
+        self.assertEqual((1, 2), results[0])
+        self.assertEqual((1, 3), results[1])
+        self.assertEqual((1, 1), results[2])
+        self.assertIsInstance(results[3], ValueError)
+        self.assertIsInstance(results[4], TypeError)
+        self.assertIs(results[0], results[5])
+
+    def test_lazy(self):
+        def headers_iterable():
+            yield {'openstack-api-version': 'service1 1.3'}
+            raise AssertionError('consumed too far')
+
+        results = microversion_parse.extract_versions(
+            headers_iterable(), 'service1', self.version_list
+        )
+        self.assertEqual((1, 3), next(results))
+
+    def test_shared_cache(self):
+        cache = microversion_parse.HeaderCache()
+        headers = {'openstack-api-version': 'service1 1.2'}
+        list(
+            microversion_parse.extract_versions(
+                [headers] * 5, 'service1', self.version_list, cache=cache
+            )
+        )
+        self.assertEqual(2, cache.misses)
+        self.assertEqual(3, cache.hits)
+
+    def test_bad_versions_list(self):
+        self.assertRaises(
+            ValueError,
+            microversion_parse.extract_versions,
+            [],
+            'service1',
+            [],
+        )
+
+
+class TestTryParseVersionString(testtools.TestCase):
+    def test_valid(self):
+        for version_string, expected in (
+            ('1.5', (1, 5)),
+            (' 2 . 10 ', (2, 10)),
+            (b'2.90', (2, 90)),
+            ('+1.-1', (1, -1)),
+            ('1_0.1', (10, 1)),
+        ):
+            version = microversion_parse.try_parse_version_string(
+                version_string
+            )
+            self.assertIsInstance(version, microversion_parse.Version)
+            self.assertEqual(expected, version)
+
+    def test_invalid(self):
+        for version_string in (
+            '',
+            '1',
+            '1.x',
+            'latest',
+            '1.2.3',
+            '1..2',
+            '++1.0',
+            '².1',
+            b'\xff.1',
+        ):
+            self.assertIsNone(
+                microversion_parse.try_parse_version_string(version_string)
+            )
+
+    def test_agrees_with_parse_version_string(self):
+        rng = random.Random(42)
+        alphabet = '10.. \t+-_x٣²'
+        for _ in range(5000):
+            version_string = ''.join(
+                rng.choice(alphabet) for _ in range(rng.randint(0, 6))
+            )
+            version = microversion_parse.try_parse_version_string(
+                version_string
+            )
+            if version is None:
+                self.assertRaises(
+                    TypeError,
+                    microversion_parse.parse_version_string,
+                    version_string,
+                )
+            else:
+                self.assertEqual(
+                    version,
+                    microversion_parse.parse_version_string(version_string),
+                )
+
+
+class TestExtractVersionLegacyHeaders(testtools.TestCase):
+    versions = ['2.1', '2.5', '2.10']
+    legacy_headers = ['x-openstack-nova-api-version']
+
+    def test_legacy_header(self):
+        headers = {'x-openstack-nova-api-version': '2.5'}
+        version = microversion_parse.extract_version(
+            headers,
+            'compute',
+            self.versions,
+            legacy_headers=self.legacy_headers,
+        )
+        self.assertEqual((2, 5), version)
+        self.assertEqual((2, 10), version.max_version)
+
+    def test_standard_header_preferred(self):
+        headers: list[tuple[str, str]] = [
+            ('X-OpenStack-Nova-API-Version', '2.5'),
+            ('OpenStack-API-Version', 'compute 2.10'),
+        ]
+        version = microversion_parse.extract_version(
+            headers,
+            'compute',
+            microversion_parse.VersionSet(self.versions),
+            legacy_headers=self.legacy_headers,
+        )
+        self.assertEqual((2, 10), version)
+
+    def test_legacy_latest(self):
+        headers = {'x-openstack-nova-api-version': 'latest'}
+        version = microversion_parse.extract_version(
+            headers,
+            'compute',
+            self.versions,
+            legacy_headers=self.legacy_headers,
+        )
+        self.assertEqual((2, 10), version)
+
+    def test_legacy_unacceptable(self):
+        headers = {'x-openstack-nova-api-version': '2.6'}
+        self.assertRaises(
+            ValueError,
+            microversion_parse.extract_version,
+            headers,
+            'compute',
+            self.versions,
+            legacy_headers=self.legacy_headers,
+        )
+
+    def test_header_lookup(self):
+        lookup = microversion_parse.HeaderLookup(
+            'compute', self.legacy_headers
+        )
+        environ = {
+            'wsgi.version': (1, 0),
+            'HTTP_X_OPENSTACK_NOVA_API_VERSION': '2.5',
+        }
+        self.assertEqual(
+            (2, 5),
+            microversion_parse.extract_version(environ, lookup, self.versions),
+        )
+
+    def test_legacy_headers_ignored_without_option(self):
+        headers = {'x-openstack-nova-api-version': '2.5'}
+        version = microversion_parse.extract_version(
+            headers, 'compute', self.versions
+        )
+        self.assertEqual((2, 1), version)
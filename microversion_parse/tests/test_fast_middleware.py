@@ -0,0 +1,113 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# The FastMicroversionMiddleware is run through the same gabbi tests, and the
+# same shared test cases, as the MicroversionMiddleware, to show that they
+# behave the same.
+
+import os
+
+from gabbi import driver
+import testtools
+import webob
+
+from microversion_parse import middleware
+from microversion_parse.tests import test_middleware
+
+
+class StreamingWSGI:
+    """A WSGI application that streams its response body."""
+
+    def __init__(self):
+        self.headers = [('content-type', 'text/plain')]
+        self.body = iter([b'one', b'two'])
+
+    def __call__(self, environ, start_response):
+        start_response('200 OK', self.headers)
+        return self.body
+
+
+class TestFastMicroversionMiddleware(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.application = StreamingWSGI()
+        self.middleware = middleware.FastMicroversionMiddleware(
+            self.application,
+            test_middleware.SERVICE_TYPE,
+            test_middleware.VERSIONS,
+        )
+
+    def test_body_passed_through(self):
+        req = webob.Request.blank(
+            '/', headers={'openstack-api-version': 'cats 1.1'}
+        )
+        status, headers, app_iter = req.call_application(self.middleware)
+        self.assertEqual('200 OK', status)
+        self.assertIs(self.application.body, app_iter)
+        self.assertIn(('openstack-api-version', 'cats 1.1'), headers)
+        self.assertIn(('vary', 'openstack-api-version'), headers)
+        self.assertEqual((1, 1), req.environ['cats.microversion'])
+        # The application's own header list is not modified.
+        self.assertEqual(
+            [('content-type', 'text/plain')], self.application.headers
+        )
+
+    def test_not_acceptable(self):
+        req = webob.Request.blank(
+            '/', headers={'openstack-api-version': 'cats 1.9'}
+        )
+        response = req.get_response(self.middleware)
+        self.assertEqual(406, response.status_code)
+        self.assertIn('Unacceptable version header', response.text)
+
+    def test_bad_request(self):
+        req = webob.Request.blank(
+            '/', headers={'openstack-api-version': 'cats 1.x'}
+        )
+        response = req.get_response(self.middleware)
+        self.assertEqual(400, response.status_code)
+        self.assertNotIn('cats.microversion', req.environ)
+
+
+class TestFastResponseHeaders(test_middleware.TestResponseHeaders):
+    middleware_class = middleware.FastMicroversionMiddleware
+
+
+class TestFastLegacyHeaders(test_middleware.TestLegacyHeaders):
+    middleware_class = middleware.FastMicroversionMiddleware
+
+
+class TestFastHeaderLimits(test_middleware.TestHeaderLimits):
+    middleware_class = middleware.FastMicroversionMiddleware
+
+
+def app():
+    app = middleware.FastMicroversionMiddleware(
+        test_middleware.SimpleWSGI(),
+        test_middleware.SERVICE_TYPE,
+        test_middleware.VERSIONS,
+    )
+    return app
+
+
+def load_tests(loader, tests, pattern):
+    """Provide a TestSuite to the discovery process."""
+    test_dir = os.path.join(
+        os.path.dirname(__file__), test_middleware.TESTS_DIR
+    )
+    suite = driver.build_tests(
+        test_dir, loader, test_loader_name=__name__, intercept=app
+    )
+    suite.addTests(tests)
+    return suite
@@ -11,6 +11,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import http.client
+from typing import Any
+
 import testtools
 
 import microversion_parse
@@ -111,6 +114,27 @@ class TestStandardHeader(testtools.TestCase):
         version = microversion_parse.check_standard_header(headers, 'compute')
         self.assertEqual('7.8', version)
 
+    def test_no_match_service_prefix(self):
+        headers = {
+            'openstack-api-version': 'compute 2.1, computer 3.1, comp 4.1',
+        }
+        version = microversion_parse.check_standard_header(headers, 'compute')
+        self.assertEqual('2.1', version)
+        version = microversion_parse.check_standard_header(headers, 'comp')
+        self.assertEqual('4.1', version)
+
+    def test_match_skips_malformed_entries(self):
+        headers = {
+            'openstack-api-version': 'compute\t2.1,, compute,compute ,',
+        }
+        version = microversion_parse.check_standard_header(headers, 'COMPUTE')
+        self.assertEqual('2.1', version)
+
+    def test_match_keeps_extra_words(self):
+        headers = {'openstack-api-version': 'compute 2.1 extra'}
+        version = microversion_parse.check_standard_header(headers, 'compute')
+        self.assertEqual('2.1 extra', version)
+
 
 class TestLegacyHeaders(testtools.TestCase):
     def test_legacy_headers_straight(self):
@@ -232,6 +256,16 @@ class TestGetHeaders(testtools.TestCase):
         )
         self.assertEqual('2.0', version)
 
+    def test_capitalized_standard_header(self):
+        headers = {
+            'Header-One': 'alpha',
+            'OpenStack-API-Version': 'compute 2.1',
+        }
+        version = microversion_parse.get_version(
+            headers, service_type='compute'
+        )
+        self.assertEqual('2.1', version)
+
     def test_capitalized_headers(self):
         headers = {'X-Openstack-Ironic-Api-Version': '123.456'}
         version = microversion_parse.get_version(
@@ -240,3 +274,339 @@ class TestGetHeaders(testtools.TestCase):
             legacy_headers=['X-Openstack-Ironic-Api-Version'],
         )
         self.assertEqual('123.456', version)
+
+    def test_message_headers(self):
+        message = http.client.HTTPMessage()
+        message['OpenStack-API-Version'] = 'compute 2.1'
+        message['OpenStack-API-Version'] = 'network 3.4'
+        message['X-OpenStack-Nova-API-Version'] = '2.5'
+        self.assertEqual(
+            '2.1',
+            microversion_parse.get_version(message, service_type='compute'),
+        )
+        self.assertEqual(
+            '2.5',
+            microversion_parse.get_version(
+                message,
+                service_type='object-store',
+                legacy_headers=['x-openstack-nova-api-version'],
+            ),
+        )
+        self.assertEqual(
+            {'compute': '2.1', 'network': '3.4'},
+            microversion_parse.get_versions(message),
+        )
+
+    def test_items_headers(self):
+        class ItemsHeaders:
+            def items(self):
+                return [('OpenStack-API-Version', 'compute 2.1')]
+
+        version = microversion_parse.get_version(
+            ItemsHeaders(), service_type='compute'
+        )
+        self.assertEqual('2.1', version)
+
+    def test_header_name_preferred(self):
+        headers = {
+            'http_openstack_api_version': 'compute 2.2',
+            'OpenStack-API-Version': 'compute 2.1',
+        }
+        version = microversion_parse.get_version(
+            headers, service_type='compute'
+        )
+        self.assertEqual('2.1', version)
+
+
+class TestBytesHeaders(testtools.TestCase):
+    def test_raw_headers(self):
+        headers = [
+            (b'host', b'example.com'),
+            (b'openstack-api-version', b'compute 2.1'),
+            (b'openstack-api-version', b'network 5.9'),
+        ]
+        version = microversion_parse.get_version(
+            headers, service_type='compute'
+        )
+        self.assertEqual('2.1', version)
+
+    def test_capitalized_raw_headers(self):
+        headers = [
+            (b'Host', b'example.com'),
+            (b'OpenStack-API-Version', b' compute 2.1 '),
+        ]
+        version = microversion_parse.get_version(
+            headers, service_type='compute'
+        )
+        self.assertEqual('2.1', version)
+
+    def test_raw_legacy_headers(self):
+        headers = [
+            (b'host', b'example.com'),
+            (b'X-OpenStack-Nova-API-Version', b'2.1'),
+            (b'x-openstack-nova-api-version', b'2.5'),
+        ]
+        version = microversion_parse.get_version(
+            headers,
+            service_type='compute',
+            legacy_headers=['x-openstack-nova-api-version'],
+        )
+        self.assertEqual('2.5', version)
+
+    def test_unrelated_headers_untouched(self):
+        # Values of headers which are not wanted are not decoded or
+        # stripped.
+        headers: list[tuple[bytes, Any]] = [
+            (b'x-unrelated-header-value', None),
+            (b'openstack-api-version', b'compute 2.1'),
+        ]
+        version = microversion_parse.get_version(
+            headers, service_type='compute'
+        )
+        self.assertEqual('2.1', version)
+
+    def test_extract_version(self):
+        headers = [(b'openstack-api-version', b'compute latest')]
+        version = microversion_parse.extract_version(
+            headers, 'compute', ['2.1', '2.2']
+        )
+        self.assertEqual((2, 2), version)
+
+    def test_parse_version_bytes(self):
+        self.assertEqual(
+            (2, 15), microversion_parse.parse_version_string(b'2.15')
+        )
+        exc = self.assertRaises(
+            TypeError, microversion_parse.parse_version_string, b'2.x'
+        )
+        self.assertIn('invalid version string: 2.x;', str(exc))
+
+
+class TestGetVersions(testtools.TestCase):
+    def test_all_services(self):
+        headers = {
+            'header-one': 'alpha',
+            'openstack-api-version': (
+                'Compute 2.1, placement latest,, bogus, compute 2.5'
+            ),
+        }
+        versions = microversion_parse.get_versions(headers)
+        self.assertEqual({'compute': '2.5', 'placement': 'latest'}, versions)
+
+    def test_listed_headers(self):
+        headers = [
+            ('OpenStack-API-Version', 'compute 2.1'),
+            ('openstack-api-version', 'placement 1.30'),
+        ]
+        versions = microversion_parse.get_versions(headers)
+        self.assertEqual({'compute': '2.1', 'placement': '1.30'}, versions)
+
+    def test_no_header(self):
+        self.assertEqual({}, microversion_parse.get_versions({'a': 'b'}))
+
+
+class TestHeaderLookup(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.lookup = microversion_parse.HeaderLookup(
+            'compute',
+            legacy_headers=[
+                'openstack-CoMpUte-api-version',
+                'x-openstack-nova-api-version',
+            ],
+        )
+
+    def test_standard_header(self):
+        headers = {
+            'openstack-api-version': 'compute 2.5',
+            'x-openstack-nova-api-version': '2.1',
+        }
+        self.assertEqual('2.5', self.lookup.get_version(headers))
+        self.assertEqual(
+            '2.5', microversion_parse.get_version(headers, self.lookup)
+        )
+
+    def test_legacy_headers_in_order(self):
+        headers = {
+            'openstack-compute-api-version': '3.7',
+            'x-openstack-nova-api-version': ' 2.1, 9.2 ',
+        }
+        self.assertEqual('3.7', self.lookup.get_version(headers))
+        del headers['openstack-compute-api-version']
+        self.assertEqual('9.2', self.lookup.get_version(headers))
+
+    def test_legacy_header_list(self):
+        headers: list[tuple[bytes, bytes]] = [
+            (b'Header-One', b'alpha'),
+            (b'X-OpenStack-Nova-API-Version', b'2.1'),
+            (b'X-OpenStack-Nova-API-Version', b'9.2'),
+        ]
+        self.assertEqual('9.2', self.lookup.get_version(headers))
+
+    def test_legacy_header_environ(self):
+        environ = {
+            'wsgi.version': (1, 0),
+            'HTTP_OPENSTACK_COMPUTE_API_VERSION': '2.1',
+        }
+        self.assertEqual('2.1', self.lookup.get_version(environ))
+
+    def test_no_version(self):
+        self.assertIsNone(self.lookup.get_version({'header-one': 'alpha'}))
+
+    def test_reusable(self):
+        headers = {'x-openstack-nova-api-version': '2.1'}
+        for _ in range(3):
+            self.assertEqual('2.1', self.lookup.get_version(headers))
+
+    def test_legacy_headers_conflict(self):
+        self.assertRaises(
+            TypeError,
+            microversion_parse.get_version,
+            {},
+            self.lookup,
+            legacy_headers=['openstack-compute-api-version'],
+        )
+
+    def test_legacy_lookup_shared(self):
+        legacy_headers = ['x-openstack-nova-api-version']
+        self.assertIs(
+            microversion_parse._lookup('compute', legacy_headers),
+            microversion_parse._lookup('compute', list(legacy_headers)),
+        )
+
+    def test_wanted_headers_only_for_lists(self):
+        self.lookup.get_version({'x-openstack-nova-api-version': '2.1'})
+        self.assertNotIn('_wanted_headers', vars(self.lookup))
+        self.lookup.get_version([('x-openstack-nova-api-version', '2.1')])
+        self.assertIn('_wanted_headers', vars(self.lookup))
+
+
+class TestHeaderLimits(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.lookup = microversion_parse.HeaderLookup(
+            'compute',
+            legacy_headers=['x-openstack-nova-api-version'],
+            max_header_length=64,
+            max_entries=3,
+        )
+
+    def test_within_limits(self):
+        headers = {'openstack-api-version': 'a 1.0, b 1.0, compute 2.1'}
+        self.assertEqual('2.1', self.lookup.get_version(headers))
+
+    def test_too_long(self):
+        headers = {'openstack-api-version': 'compute 2.1' + ' ' * 60}
+        exc = self.assertRaises(
+            microversion_parse.HeaderTooLarge,
+            self.lookup.get_version,
+            headers,
+        )
+        self.assertEqual(
+            'openstack-api-version header is longer than 64', str(exc)
+        )
+
+    def test_too_many_entries(self):
+        headers = [
+            ('OpenStack-API-Version', 'a 1.0, b 1.0'),
+            ('OpenStack-API-Version', 'c 1.0, compute 2.1'),
+        ]
+        exc = self.assertRaises(
+            microversion_parse.HeaderTooLarge,
+            self.lookup.get_version,
+            headers,
+        )
+        self.assertEqual(
+            'openstack-api-version header has more than 3 entries', str(exc)
+        )
+
+    def test_list_checked_while_folding(self):
+        folded = []
+
+        def headers():
+            for i in range(10000):
+                folded.append(i)
+                yield ('OpenStack-API-Version', f'svc{i} 1.0')
+
+        self.assertRaises(
+            microversion_parse.HeaderTooLarge,
+            self.lookup.get_version,
+            headers(),
+        )
+        self.assertEqual(4, len(folded))
+
+    def test_legacy_header_too_long(self):
+        headers = {'x-openstack-nova-api-version': '2.1,' * 20}
+        self.assertRaises(
+            microversion_parse.HeaderTooLarge,
+            self.lookup.get_version,
+            headers,
+        )
+
+    def test_is_type_error(self):
+        version_set = microversion_parse.VersionSet(['2.1'])
+        headers = {'openstack-api-version': 'a, b, c, compute 2.1'}
+        stats = microversion_parse.MicroversionStats()
+        self.assertRaises(
+            TypeError,
+            microversion_parse.extract_version,
+            headers,
+            self.lookup,
+            version_set,
+            stats=stats,
+        )
+        self.assertEqual(1, stats.counters['too_large'])
+        self.assertEqual(0, stats.counters['invalid'])
+
+    def test_checked_before_cache(self):
+        cache = microversion_parse.HeaderCache()
+        header = 'a 1.0, b 1.0, c 1.0, compute 2.1'
+        self.assertEqual(
+            '2.1',
+            microversion_parse.get_version(
+                {'openstack-api-version': header}, 'compute', cache=cache
+            ),
+        )
+        self.assertRaises(
+            microversion_parse.HeaderTooLarge,
+            self.lookup.get_version,
+            {'openstack-api-version': header},
+            cache,
+        )
+
+    def test_get_versions(self):
+        header = 'a 1.0, b 1.0, compute 2.1'
+        self.assertEqual(
+            {'a': '1.0', 'b': '1.0', 'compute': '2.1'},
+            microversion_parse.get_versions(
+                {'openstack-api-version': header}, 64, 3
+            ),
+        )
+        for headers in (
+            {'openstack-api-version': header + ' ' * 60},
+            {'HTTP_OPENSTACK_API_VERSION': header, 'wsgi.version': (1, 0)},
+            [('OpenStack-API-Version', 'a 1.0, b 1.0, c 1.0, compute 2.1')],
+        ):
+            self.assertRaises(
+                microversion_parse.HeaderTooLarge,
+                microversion_parse.get_versions,
+                headers,
+                max_header_length=len(header) - 1,
+                max_entries=3,
+            )
+
+    def test_get_versions_checked_while_folding(self):
+        folded = []
+
+        def headers():
+            for i in range(10000):
+                folded.append(i)
+                yield ('OpenStack-API-Version', f'svc{i} 1.0')
+
+        self.assertRaises(
+            microversion_parse.HeaderTooLarge,
+            microversion_parse.get_versions,
+            headers(),
+            max_entries=3,
+        )
+        self.assertEqual(4, len(folded))
@@ -0,0 +1,249 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import threading
+
+import testtools
+
+import microversion_parse
+
+
+class TestHeaderCache(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = microversion_parse.HeaderCache(maxsize=2)
+
+    def fill(self, header, service_type='compute'):
+        # Header values are cached once they have been seen twice.
+        self.cache.get(header, service_type)
+        return self.cache.get(header, service_type)
+
+    def test_get_version(self):
+        headers = {'openstack-api-version': 'network 5.9, compute 2.1'}
+        for _ in range(3):
+            version = microversion_parse.get_version(
+                headers, 'compute', cache=self.cache
+            )
+            self.assertEqual('2.1', version)
+        self.assertEqual(1, len(self.cache))
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(2, self.cache.misses)
+
+    def test_get_parses_version(self):
+        version_string, version = self.fill('compute 2.1')
+        self.assertEqual('2.1', version_string)
+        self.assertEqual((2, 1), version)
+        self.assertIs(version, self.cache.get('compute 2.1', 'compute')[1])
+
+    def test_latest(self):
+        self.assertEqual(('latest', None), self.fill('compute latest'))
+        self.assertEqual(1, len(self.cache))
+
+    def test_service_type_in_key(self):
+        header = 'network 5.9, compute 2.1'
+        self.assertEqual((5, 9), self.fill(header, 'network')[1])
+        self.assertEqual((2, 1), self.fill(header, 'compute')[1])
+        self.assertEqual(2, len(self.cache))
+
+    def test_eviction(self):
+        self.fill('compute 2.1')
+        self.fill('compute 2.2')
+        # Use the first entry so the second is least recently used.
+        self.cache.get('compute 2.1', 'compute')
+        self.fill('compute 2.3')
+        self.assertEqual(2, len(self.cache))
+        self.assertEqual(1, self.cache.evictions)
+        self.cache.get('compute 2.1', 'compute')
+        self.assertEqual(2, self.cache.hits)
+        self.cache.get('compute 2.2', 'compute')
+        self.assertEqual(7, self.cache.misses)
+
+    def test_seen_once_not_cached(self):
+        self.cache.get('compute 2.1', 'compute')
+        self.assertEqual(0, len(self.cache))
+        self.cache.get('compute 2.1', 'compute')
+        self.assertEqual(1, len(self.cache))
+
+    def test_flood(self):
+        cache = microversion_parse.HeaderCache(maxsize=4)
+        version_set = microversion_parse.VersionSet(['2.1', '2.2'])
+        cache.warm('compute', version_set)
+        cache.get('network 5.9', 'network')
+        cache.get('network 5.9', 'network')
+        for i in range(1000):
+            cache.get(f'compute 2.1, junk{i} 1.0', 'compute')
+            cache.get(f'compute 2.{i}', 'compute')
+        self.assertEqual(0, cache.evictions)
+        self.assertEqual(4, len(cache))
+        hits = cache.hits
+        for header in ('compute 2.1', 'compute 2.2', 'compute latest'):
+            cache.get(header, 'compute')
+        cache.get('network 5.9', 'network')
+        self.assertEqual(hits + 4, cache.hits)
+
+    def test_not_cached(self):
+        # Header values without a valid version for the service, or which
+        # are too long, are not cached.
+        self.assertEqual(
+            (None, None), self.cache.get('network 5.9', 'compute')
+        )
+        self.assertEqual(
+            ('2.x', None), self.cache.get('compute 2.x', 'compute')
+        )
+        long_header = 'network 5.9,' * 30 + 'compute 2.1'
+        self.assertEqual((2, 1), self.cache.get(long_header, 'compute')[1])
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(3, self.cache.misses)
+
+    def test_clear(self):
+        self.fill('compute 2.1')
+        self.cache.warm('compute', ['2.2'])
+        self.cache.clear()
+        self.assertEqual(0, len(self.cache))
+        self.assertEqual(0, self.cache.hits)
+        self.assertEqual(0, self.cache.misses)
+
+    def test_invalid_maxsize(self):
+        self.assertRaises(ValueError, microversion_parse.HeaderCache, 0)
+
+    def test_extract_version(self):
+        headers = {'openstack-api-version': 'compute 1.2'}
+        versions = ['1.1', '1.2', '1.3']
+        version_set = microversion_parse.VersionSet(versions)
+        for versions_list in (versions, version_set, versions):
+            version = microversion_parse.extract_version(
+                headers, 'compute', versions_list, cache=self.cache
+            )
+            self.assertEqual((1, 2), version)
+            self.assertEqual((1, 3), version.max_version)
+        self.assertEqual(1, self.cache.hits)
+        # The cached version is not modified.
+        cached_version = self.cache.get('compute 1.2', 'compute')[1]
+        assert cached_version is not None
+        self.assertEqual((-1, 0), cached_version.max_version)
+
+    def test_extract_version_errors(self):
+        versions = ['1.1', '1.2', '1.3']
+        self.assertRaises(
+            ValueError,
+            microversion_parse.extract_version,
+            {'openstack-api-version': 'compute 1.4'},
+            'compute',
+            versions,
+            cache=self.cache,
+        )
+        self.assertRaises(
+            TypeError,
+            microversion_parse.extract_version,
+            {'openstack-api-version': 'compute 1.x'},
+            'compute',
+            versions,
+            cache=self.cache,
+        )
+
+
+class TestSharedHeaderCache(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = microversion_parse.HeaderCache()
+
+    def test_warm(self):
+        version_set = microversion_parse.VersionSet(['2.1', '2.2'])
+        self.cache.warm('compute', version_set)
+        self.assertEqual(3, len(self.cache))
+        self.assertEqual(0, self.cache.misses)
+        version = microversion_parse.extract_version(
+            {'openstack-api-version': 'compute latest'},
+            'compute',
+            version_set,
+            cache=self.cache,
+        )
+        self.assertEqual((2, 2), version)
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(0, self.cache.misses)
+
+    def test_stats(self):
+        for _ in range(3):
+            self.cache.get('compute 2.1', 'compute')
+        self.assertEqual(
+            {
+                'pid': os.getpid(),
+                'size': 1,
+                'hits': 1,
+                'misses': 2,
+                'evictions': 0,
+            },
+            self.cache.stats(),
+        )
+
+    def test_after_fork(self):
+        self.cache.warm('compute', ['2.1'])
+        self.cache.get('compute 2.1', 'compute')
+        lock = self.cache._lock
+        microversion_parse._after_fork_in_child()
+        self.assertIsNot(lock, self.cache._lock)
+        self.assertEqual(0, self.cache.hits)
+        # The warmed entries are kept.
+        self.assertEqual(2, len(self.cache))
+
+    @testtools.skipUnless(hasattr(os, 'fork'), 'requires fork')
+    def test_fork(self):
+        self.cache.warm('compute', ['2.1'])
+        self.cache.get('compute 2.1', 'compute')
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                self.cache.get('compute 2.1', 'compute')
+                stats = self.cache.stats()
+                inherited = (
+                    stats['pid'] == os.getpid()
+                    and stats['hits'] == 1
+                    and stats['misses'] == 0
+                    and stats['size'] == 2
+                )
+                os.write(write_fd, b'ok' if inherited else b'bad')
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as child:
+            result = child.read()
+        os.waitpid(pid, 0)
+        self.assertEqual(b'ok', result)
+        # The parent's counters are untouched.
+        self.assertEqual(1, self.cache.hits)
+
+    def test_threads(self):
+        cache = microversion_parse.HeaderCache(maxsize=8)
+        errors = []
+
+        def get():
+            try:
+                for minor in range(2000):
+                    header = f'compute 2.{minor % 16}'
+                    version = cache.get(header, 'compute')[1]
+                    assert version == (2, minor % 16)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertLessEqual(len(cache), 8)
+        self.assertEqual(16000, cache.hits + cache.misses)
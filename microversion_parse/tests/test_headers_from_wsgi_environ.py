@@ -64,3 +64,117 @@ class TestHeadersFromWSGIEnviron(testtools.TestCase):
             legacy_headers=['x-openstack-placement-api-version'],
         )
         self.assertEqual(expected_version, version)
+
+    def test_get_version_from_environ_directly(self):
+        environ = {
+            'wsgi.version': (1, 0),
+            'PATH_INFO': '/foo/bar',
+            'HTTP_OPENSTACK_API_VERSION': 'placement 2.1',
+            'HTTP_CONTENT_TYPE': 'application/json',
+        }
+        version = microversion_parse.get_version(environ, 'placement')
+        self.assertEqual('2.1', version)
+
+    def test_get_version_from_environ_directly_legacy(self):
+        environ = {
+            'wsgi.version': (1, 0),
+            'PATH_INFO': '/foo/bar',
+            'HTTP_X_OPENSTACK_PLACEMENT_API_VERSION': '2.1',
+        }
+        version = microversion_parse.get_version(
+            environ,
+            'placement',
+            legacy_headers=['X-OpenStack-Placement-API-Version'],
+        )
+        self.assertEqual('2.1', version)
+
+    def test_get_version_from_environ_directly_absent(self):
+        environ = {
+            'wsgi.version': (1, 0),
+            'PATH_INFO': '/foo/bar',
+            'HTTP_CONTENT_TYPE': 'application/json',
+        }
+        version = microversion_parse.get_version(
+            environ,
+            'placement',
+            legacy_headers=['x-openstack-placement-api-version'],
+        )
+        self.assertIsNone(version)
+
+
+class TestWSGIEnvironHeaders(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.environ = {
+            'wsgi.version': (1, 0),
+            'PATH_INFO': '/foo/bar',
+            'HTTP_OPENSTACK_API_VERSION': 'placement 2.1',
+            'CONTENT_TYPE': 'application/json',
+        }
+        self.headers = microversion_parse.WSGIEnvironHeaders(self.environ)
+
+    def test_lookup(self):
+        self.assertEqual(
+            'placement 2.1', self.headers['OpenStack-API-Version']
+        )
+        self.assertEqual('application/json', self.headers['content-type'])
+        self.assertIn('openstack-api-version', self.headers)
+        self.assertNotIn('path-info', self.headers)
+        self.assertIsNone(self.headers.get('x-openstack-request-id'))
+        self.assertRaises(KeyError, lambda: self.headers['path-info'])
+
+    def test_iterate(self):
+        self.assertEqual(
+            {
+                'openstack-api-version': 'placement 2.1',
+                'content-type': 'application/json',
+            },
+            dict(self.headers),
+        )
+        self.assertEqual(2, len(self.headers))
+
+    def test_content_headers_unprefixed(self):
+        self.environ['CONTENT_LENGTH'] = '12'
+        self.environ['HTTP_CONTENT_TYPE'] = 'text/plain'
+        self.assertEqual('application/json', self.headers['Content-Type'])
+        self.assertEqual('12', self.headers['Content-Length'])
+        self.assertIn('content-length', self.headers)
+        self.assertEqual(
+            {
+                'openstack-api-version': 'placement 2.1',
+                'content-type': 'application/json',
+                'content-length': '12',
+            },
+            dict(self.headers),
+        )
+        self.assertEqual(3, len(self.headers))
+
+    def test_not_copied(self):
+        self.environ['HTTP_OPENSTACK_API_VERSION'] = 'placement 2.5'
+        self.assertEqual(
+            'placement 2.5', self.headers['openstack-api-version']
+        )
+
+    def test_get_version(self):
+        self.assertEqual(
+            '2.1', microversion_parse.get_version(self.headers, 'placement')
+        )
+
+    def test_get_version_legacy(self):
+        del self.environ['HTTP_OPENSTACK_API_VERSION']
+        self.environ['HTTP_X_OPENSTACK_PLACEMENT_API_VERSION'] = '2.3'
+        version = microversion_parse.get_version(
+            self.headers,
+            'placement',
+            legacy_headers=['x-openstack-placement-api-version'],
+        )
+        self.assertEqual('2.3', version)
+
+    def test_fold_headers(self):
+        self.assertEqual(
+            {
+                'openstack-api-version': 'placement 2.1',
+                'content-type': 'application/json',
+            },
+            microversion_parse.fold_headers(self.headers),
+        )
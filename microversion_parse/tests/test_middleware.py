@@ -18,6 +18,7 @@
 import os
 
 from gabbi import driver
+import testtools
 import webob
 
 from microversion_parse import middleware
@@ -44,6 +45,94 @@ class SimpleWSGI:
         raise webob.exc.HTTPNotFound(f'{path_info} not found')
 
 
+class VaryingWSGI:
+    """A WSGI application which sets its own vary header."""
+
+    def __init__(self, vary):
+        self.vary = vary
+
+    def __call__(self, environ, start_response):
+        start_response(
+            '200 OK', [('content-type', 'text/plain'), ('Vary', self.vary)]
+        )
+        return [b'varied']
+
+
+class MiddlewareTestCase(testtools.TestCase):
+    """A test case for the behaviour shared by the middlewares.
+
+    Subclasses run the same tests against the FastMicroversionMiddleware by
+    setting ``middleware_class``.
+    """
+
+    middleware_class: type[middleware.MicroversionMiddleware] = (
+        middleware.MicroversionMiddleware
+    )
+
+    def make_app(self, application=None, **kwargs):
+        if application is None:
+            application = SimpleWSGI()
+        return self.middleware_class(
+            application, SERVICE_TYPE, VERSIONS, **kwargs
+        )
+
+
+class TestResponseHeaders(MiddlewareTestCase):
+    def _get(self, app):
+        req = webob.Request.blank(
+            '/', headers={'openstack-api-version': 'cats 1.1'}
+        )
+        response = req.get_response(app)
+        self.assertEqual(200, response.status_code)
+        return response
+
+    def test_vary_not_duplicated(self):
+        for vary in ('OpenStack-API-Version', 'accept, *'):
+            response = self._get(self.make_app(VaryingWSGI(vary)))
+            self.assertEqual([vary], response.headers.getall('vary'))
+            self.assertEqual(
+                'cats 1.1', response.headers['openstack-api-version']
+            )
+
+    def test_vary_added(self):
+        response = self._get(self.make_app(VaryingWSGI('accept')))
+        self.assertEqual(
+            ['accept', 'openstack-api-version'],
+            response.headers.getall('vary'),
+        )
+
+
+class TestLegacyHeaders(MiddlewareTestCase):
+    def test_legacy_header(self):
+        app = self.make_app(legacy_headers=['x-openstack-cats-api-version'])
+        req = webob.Request.blank(
+            '/good', headers={'X-OpenStack-Cats-API-Version': '1.1'}
+        )
+        response = req.get_response(app)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual((1, 1), req.environ['cats.microversion'])
+        self.assertEqual('cats 1.1', response.headers['openstack-api-version'])
+
+
+class TestHeaderLimits(MiddlewareTestCase):
+    def test_too_large(self):
+        app = self.make_app(max_header_length=1024, max_entries=10)
+        for header in (
+            'cats 1.1' + ' ' * 1024,
+            ', '.join(['dogs 1.0'] * 10 + ['cats 1.1']),
+        ):
+            req = webob.Request.blank(
+                '/good', headers={'openstack-api-version': header}
+            )
+            response = req.get_response(app)
+            self.assertEqual(431, response.status_code)
+            self.assertNotIn('cats.microversion', req.environ)
+        req = webob.Request.blank(
+            '/good', headers={'openstack-api-version': 'cats 1.1'}
+        )
+        self.assertEqual(200, req.get_response(app).status_code)
+
+
 def app():
     app = middleware.MicroversionMiddleware(
         SimpleWSGI(), SERVICE_TYPE, VERSIONS
@@ -54,6 +143,8 @@ def app():
 def load_tests(loader, tests, pattern):
     """Provide a TestSuite to the discovery process."""
     test_dir = os.path.join(os.path.dirname(__file__), TESTS_DIR)
-    return driver.build_tests(
+    suite = driver.build_tests(
         test_dir, loader, test_loader_name=__name__, intercept=app
     )
+    suite.addTests(tests)
+    return suite
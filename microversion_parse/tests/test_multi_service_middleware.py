@@ -0,0 +1,136 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import testtools
+import webob
+
+import microversion_parse
+from microversion_parse import middleware
+from microversion_parse.tests import test_middleware
+
+
+class TestMultiServiceMicroversionMiddleware(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.middleware = middleware.MultiServiceMicroversionMiddleware(
+            test_middleware.SimpleWSGI(),
+            {'cats': ['1.0', '1.1', '1.2'], 'Dogs': ['2.0', '2.1']},
+        )
+
+    def _get(self, path, header=None):
+        headers = {'accept': 'application/json'}
+        if header is not None:
+            headers['openstack-api-version'] = header
+        req = webob.Request.blank(path, headers=headers)
+        return req, req.get_response(self.middleware)
+
+    def test_defaults(self):
+        req, response = self._get('/good')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual((1, 0), req.environ['cats.microversion'])
+        self.assertEqual((2, 0), req.environ['Dogs.microversion'])
+        self.assertEqual(
+            {'cats': (1, 0), 'Dogs': (2, 0)},
+            req.environ['openstack.microversions'],
+        )
+        self.assertEqual(
+            ['cats 1.0', 'Dogs 2.0'],
+            response.headers.getall('openstack-api-version'),
+        )
+        self.assertEqual('openstack-api-version', response.headers['vary'])
+
+    def test_versions(self):
+        req, response = self._get(
+            '/good', 'cats 1.1, dogs latest, birds 7.0, cats 1.2'
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            {'cats': (1, 2), 'Dogs': (2, 1)},
+            req.environ['openstack.microversions'],
+        )
+        self.assertEqual(
+            ['cats 1.2', 'Dogs 2.1'],
+            response.headers.getall('openstack-api-version'),
+        )
+
+    def test_negotiations(self):
+        header = 'cats 1.1, dogs latest'
+        req, response = self._get('/good', header)
+        cats = req.environ['cats.microversion_negotiation']
+        self.assertEqual((1, 1), cats.version)
+        self.assertEqual(microversion_parse.Negotiation.HEADER, cats.source)
+        self.assertEqual('openstack-api-version', cats.header_name)
+        self.assertEqual(header, cats.header_value)
+        self.assertEqual(
+            ('openstack-api-version', 'cats 1.1'), cats.version_header
+        )
+        dogs = req.environ['Dogs.microversion_negotiation']
+        self.assertEqual((2, 1), dogs.version)
+        self.assertTrue(dogs.latest)
+
+    def test_negotiations_default(self):
+        req, response = self._get('/good')
+        cats = req.environ['cats.microversion_negotiation']
+        self.assertEqual(microversion_parse.Negotiation.DEFAULT, cats.source)
+        self.assertIsNone(cats.header_name)
+        self.assertIsNone(cats.header_value)
+
+    def test_not_acceptable(self):
+        req, response = self._get('/good', 'cats 1.1, dogs 2.5')
+        self.assertEqual(406, response.status_code)
+        self.assertIn('Unacceptable version header: 2.5', response.text)
+
+    def test_bad_request(self):
+        req, response = self._get('/good', 'cats 1.x')
+        self.assertEqual(400, response.status_code)
+        self.assertNotIn('openstack.microversions', req.environ)
+
+    def test_header_present_on_exception(self):
+        req, response = self._get('/bad', 'dogs 2.1')
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(
+            ['cats 1.0', 'Dogs 2.1'],
+            response.headers.getall('openstack-api-version'),
+        )
+
+    def test_vary_not_duplicated(self):
+        app = middleware.MultiServiceMicroversionMiddleware(
+            test_middleware.VaryingWSGI('openstack-api-version'),
+            {'cats': test_middleware.VERSIONS, 'dogs': ['1.0']},
+        )
+        req = webob.Request.blank(
+            '/', headers={'openstack-api-version': 'cats 1.1'}
+        )
+        response = req.get_response(app)
+        self.assertEqual(
+            ['openstack-api-version'], response.headers.getall('vary')
+        )
+        self.assertEqual(
+            ['cats 1.1', 'dogs 1.0'],
+            response.headers.getall('openstack-api-version'),
+        )
+
+    def test_header_too_large(self):
+        self.middleware = middleware.MultiServiceMicroversionMiddleware(
+            test_middleware.SimpleWSGI(),
+            {'cats': ['1.0', '1.1', '1.2'], 'Dogs': ['2.0', '2.1']},
+            max_header_length=64,
+            max_entries=3,
+        )
+        req, response = self._get('/good', 'cats 1.1, dogs 2.1')
+        self.assertEqual(200, response.status_code)
+        for header in ('cats 1.1' + ' ' * 60, 'a 1.0, b 1.0, c 1.0, cats 1.1'):
+            req, response = self._get('/good', header)
+            self.assertEqual(431, response.status_code)
+            self.assertNotIn('openstack.microversions', req.environ)
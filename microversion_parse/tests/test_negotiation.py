@@ -0,0 +1,129 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import testtools
+import webob
+
+import microversion_parse
+from microversion_parse import middleware
+from microversion_parse.tests import test_middleware
+
+
+class TestNegotiation(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.version_set = microversion_parse.VersionSet(['1.0', '1.1', '1.2'])
+
+    def test_header(self):
+        header = 'compute 2.1, placement 1.1'
+        negotiation = self.version_set.negotiate(
+            {'OpenStack-API-Version': header}, 'placement'
+        )
+        self.assertEqual((1, 1), negotiation.version)
+        self.assertEqual((1, 2), negotiation.version.max_version)
+        self.assertEqual('header', negotiation.source)
+        self.assertFalse(negotiation.latest)
+        self.assertEqual('openstack-api-version', negotiation.header_name)
+        self.assertEqual(header, negotiation.header_value)
+        self.assertEqual(
+            (
+                ('openstack-api-version', 'placement 1.1'),
+                ('vary', 'openstack-api-version'),
+            ),
+            negotiation.response_headers,
+        )
+        self.assertEqual(
+            ('openstack-api-version', 'placement 1.1'),
+            negotiation.version_header,
+        )
+
+    def test_latest(self):
+        negotiation = self.version_set.negotiate(
+            [('openstack-api-version', 'placement latest')], 'placement'
+        )
+        self.assertEqual((1, 2), negotiation.version)
+        self.assertEqual('latest', negotiation.source)
+        self.assertTrue(negotiation.latest)
+
+    def test_default(self):
+        negotiation = self.version_set.negotiate({}, 'placement')
+        self.assertEqual((1, 0), negotiation.version)
+        self.assertEqual('default', negotiation.source)
+        self.assertIsNone(negotiation.header_name)
+        self.assertIsNone(negotiation.header_value)
+        self.assertEqual(
+            ('openstack-api-version', 'placement 1.0'),
+            negotiation.version_header,
+        )
+
+    def test_legacy_header(self):
+        lookup = microversion_parse.HeaderLookup(
+            'placement', ['x-openstack-placement-api-version']
+        )
+        negotiation = self.version_set.negotiate(
+            {'X-OpenStack-Placement-API-Version': '1.1'}, lookup
+        )
+        self.assertEqual((1, 1), negotiation.version)
+        self.assertEqual('header', negotiation.source)
+        self.assertEqual(
+            'x-openstack-placement-api-version', negotiation.header_name
+        )
+        self.assertEqual('1.1', negotiation.header_value)
+
+    def test_response_headers_reused(self):
+        headers = {'openstack-api-version': 'placement 1.1'}
+        first = self.version_set.negotiate(headers, 'placement')
+        second = self.version_set.negotiate(headers, 'placement')
+        self.assertIs(first.response_headers, second.response_headers)
+        other = self.version_set.negotiate(
+            {'openstack-api-version': 'compute 1.1'}, 'compute'
+        )
+        self.assertEqual(
+            ('openstack-api-version', 'compute 1.1'), other.version_header
+        )
+
+    def test_errors(self):
+        stats = microversion_parse.MicroversionStats()
+        for version, exc in (('1.9', ValueError), ('1.x', TypeError)):
+            self.assertRaises(
+                exc,
+                self.version_set.negotiate,
+                {'openstack-api-version': f'placement {version}'},
+                'placement',
+                stats=stats,
+            )
+        self.assertEqual(1, stats.counters['unacceptable'])
+        self.assertEqual(1, stats.counters['invalid'])
+
+
+class TestMiddlewareNegotiation(test_middleware.MiddlewareTestCase):
+    def test_environ(self):
+        app = self.make_app()
+        req = webob.Request.blank(
+            '/good', headers={'openstack-api-version': 'cats latest'}
+        )
+        response = req.get_response(app)
+        self.assertEqual(200, response.status_code)
+        negotiation = req.environ['cats.microversion_negotiation']
+        self.assertIsInstance(negotiation, microversion_parse.Negotiation)
+        self.assertIs(negotiation.version, req.environ['cats.microversion'])
+        self.assertTrue(negotiation.latest)
+        self.assertEqual(
+            negotiation.version_header[1],
+            response.headers['openstack-api-version'],
+        )
+
+
+class TestFastMiddlewareNegotiation(TestMiddlewareNegotiation):
+    middleware_class = middleware.FastMicroversionMiddleware
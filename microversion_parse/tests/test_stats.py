@@ -0,0 +1,136 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import testtools
+import webob
+
+import microversion_parse
+from microversion_parse import middleware
+from microversion_parse.tests import test_middleware
+
+
+class TestMicroversionStats(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.stats = microversion_parse.MicroversionStats()
+        self.version_set = microversion_parse.VersionSet(['1.0', '1.1'])
+
+    def test_get_version(self):
+        headers = {'openstack-api-version': 'compute 2.1'}
+        microversion_parse.get_version(headers, 'compute', stats=self.stats)
+        microversion_parse.get_version({}, 'compute', stats=self.stats)
+        snapshot = self.stats.snapshot()
+        self.assertEqual(1, snapshot['header_present'])
+        self.assertEqual(1, snapshot['header_absent'])
+        self.assertEqual(0, snapshot['latest'])
+        self.assertEqual(2, snapshot['parse']['count'])
+        self.assertEqual(0, snapshot['middleware']['count'])
+
+    def test_latest(self):
+        headers = {'openstack-api-version': 'compute latest'}
+        version = microversion_parse.extract_version(
+            headers, 'compute', ['1.0', '1.1'], stats=self.stats
+        )
+        self.assertEqual((1, 1), version)
+        self.assertEqual(1, self.stats.counters['latest'])
+        self.assertEqual(1, self.stats.counters['header_present'])
+
+    def test_errors(self):
+        for version, exc in (('2.0', ValueError), ('2.x', TypeError)):
+            headers = {'openstack-api-version': f'compute {version}'}
+            self.assertRaises(
+                exc,
+                microversion_parse.extract_version,
+                headers,
+                'compute',
+                self.version_set,
+                stats=self.stats,
+            )
+        self.assertEqual(1, self.stats.counters['unacceptable'])
+        self.assertEqual(1, self.stats.counters['invalid'])
+        self.assertEqual(2, self.stats.snapshot()['parse']['count'])
+
+    def test_cache_hits(self):
+        cache = microversion_parse.HeaderCache()
+        headers = {'openstack-api-version': 'compute 1.1'}
+        for _ in range(3):
+            self.version_set.extract(
+                headers, 'compute', cache=cache, stats=self.stats
+            )
+        # The header value is only cached once it has been seen twice.
+        self.assertEqual(1, self.stats.counters['cache_hit'])
+        self.assertEqual(3, self.stats.counters['header_present'])
+
+    def test_histogram(self):
+        stats = microversion_parse.MicroversionStats(buckets=[0.5, 0.1])
+        self.assertEqual((0.1, 0.5), stats.buckets)
+        for seconds in (0.05, 0.1, 0.2, 1.0):
+            stats.observe('parse', seconds)
+        self.assertEqual(
+            {
+                'buckets': [(0.1, 2), (0.5, 1), (float('inf'), 1)],
+                'count': 4,
+                'sum': 1.35,
+            },
+            stats.snapshot()['parse'],
+        )
+
+    def test_reset(self):
+        self.stats.count('latest')
+        self.stats.observe('middleware', 0.1)
+        self.stats.reset()
+        snapshot = self.stats.snapshot()
+        self.assertEqual(0, snapshot['latest'])
+        self.assertEqual(0, snapshot['middleware']['count'])
+
+    def test_subclass_callbacks(self):
+        events = []
+
+        class Stats(microversion_parse.MicroversionStats):
+            def count(self, event):
+                super().count(event)
+                events.append(event)
+
+        microversion_parse.get_version(
+            {'openstack-api-version': 'compute 2.1'}, 'compute', stats=Stats()
+        )
+        self.assertEqual(['header_present'], events)
+
+
+class TestMiddlewareStats(test_middleware.MiddlewareTestCase):
+    def test_statuses(self):
+        stats = microversion_parse.MicroversionStats()
+        app = self.make_app(stats=stats)
+        for version, status in (
+            ('1.1', 200),
+            ('9.9', 406),
+            ('1.x', 400),
+            (None, 200),
+        ):
+            headers: dict[str, str] = {}
+            if version is not None:
+                headers['openstack-api-version'] = f'cats {version}'
+            req = webob.Request.blank('/good', headers=headers)
+            self.assertEqual(status, req.get_response(app).status_code)
+        snapshot = stats.snapshot()
+        self.assertEqual(3, snapshot['header_present'])
+        self.assertEqual(1, snapshot['header_absent'])
+        self.assertEqual(1, snapshot['unacceptable'])
+        self.assertEqual(1, snapshot['invalid'])
+        self.assertEqual(4, snapshot['parse']['count'])
+        self.assertEqual(4, snapshot['middleware']['count'])
+
+
+class TestFastMiddlewareStats(TestMiddlewareStats):
+    middleware_class = middleware.FastMicroversionMiddleware
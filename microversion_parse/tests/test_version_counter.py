@@ -0,0 +1,137 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import threading
+
+import testtools
+import webob
+
+import microversion_parse
+from microversion_parse import middleware
+from microversion_parse.tests import test_middleware
+
+
+class TestVersionCounter(testtools.TestCase):
+    def test_count(self):
+        counter = microversion_parse.VersionCounter()
+        counter.count(microversion_parse.Version(1, 1))
+        counter.count((1, 1))
+        counter.count((1, 0))
+        self.assertEqual({'1.0': 1, '1.1': 2}, counter.snapshot())
+
+    def test_versions_counted_from_zero(self):
+        counter = microversion_parse.VersionCounter(['1.0', '1.2', '1.10'])
+        counter.count((1, 10))
+        self.assertEqual({'1.0': 0, '1.2': 0, '1.10': 1}, counter.snapshot())
+
+    def test_version_set(self):
+        version_set = microversion_parse.VersionSet(['1.0', '1.1'])
+        counter = microversion_parse.VersionCounter(version_set)
+        counter.count(version_set.select('1.1'))
+        self.assertEqual({'1.0': 0, '1.1': 1}, counter.snapshot())
+
+    def test_reset(self):
+        counter = microversion_parse.VersionCounter(['1.0'])
+        counter.count((1, 0))
+        counter.reset()
+        self.assertEqual({'1.0': 0}, counter.snapshot())
+
+    def test_threads(self):
+        counter = microversion_parse.VersionCounter()
+
+        def count():
+            for minor in range(1000):
+                counter.count((1, minor % 4))
+
+        threads = [threading.Thread(target=count) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            {'1.0': 2000, '1.1': 2000, '1.2': 2000, '1.3': 2000},
+            counter.snapshot(),
+        )
+
+    def test_snapshot_while_counting(self):
+        counter = microversion_parse.VersionCounter()
+        done = threading.Event()
+
+        def count():
+            for minor in range(20000):
+                counter.count((1, minor % 50))
+            done.set()
+
+        thread = threading.Thread(target=count)
+        thread.start()
+        while not done.is_set():
+            counter.snapshot()
+        thread.join()
+        self.assertEqual(400, counter.snapshot()['1.49'])
+
+    def test_short_lived_threads(self):
+        counter = microversion_parse.VersionCounter()
+
+        def count():
+            counter.count((1, 1))
+
+        for _ in range(5):
+            threads = [threading.Thread(target=count) for _ in range(50)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual({'1.1': 250}, counter.snapshot())
+        self.assertEqual(counter.shards, len(counter._shards))
+        self.assertLessEqual(
+            sum(len(counts) for counts, lock in counter._shards),
+            counter.shards,
+        )
+
+
+class TestMiddlewareVersionCounter(test_middleware.MiddlewareTestCase):
+    def test_counted(self):
+        counter = microversion_parse.VersionCounter(test_middleware.VERSIONS)
+        app = self.make_app(version_counter=counter)
+        for version in ('1.1', '1.1', 'latest', '9.9'):
+            req = webob.Request.blank(
+                '/good',
+                headers={'openstack-api-version': f'cats {version}'},
+            )
+            req.get_response(app)
+        req = webob.Request.blank('/good')
+        req.get_response(app)
+        snapshot = counter.snapshot()
+        self.assertEqual(1, snapshot['1.0'])
+        self.assertEqual(2, snapshot['1.1'])
+        self.assertEqual(1, snapshot[test_middleware.VERSIONS[-1]])
+        self.assertEqual(4, sum(snapshot.values()))
+
+
+class TestFastMiddlewareVersionCounter(TestMiddlewareVersionCounter):
+    middleware_class = middleware.FastMicroversionMiddleware
+
+
+class TestVersionCountsApplication(testtools.TestCase):
+    def test_counts_application(self):
+        counter = microversion_parse.VersionCounter(['1.0', '1.1'])
+        counter.count((1, 1))
+        app = middleware.VersionCountsApplication({'cats': counter})
+        response = webob.Request.blank('/versions').get_response(app)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('application/json', response.content_type)
+        self.assertEqual(
+            {'cats': {'1.0': 0, '1.1': 1}}, json.loads(response.body)
+        )
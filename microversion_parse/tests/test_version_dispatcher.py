@@ -0,0 +1,80 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import testtools
+
+import microversion_parse
+
+VERSIONS = ['1.0', '1.1', '1.2', '1.3']
+
+
+class TestVersionDispatcher(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.show = microversion_parse.VersionDispatcher(VERSIONS)
+
+        @self.show.register(max_version='1.1')
+        def show_v1_0(name):
+            return f'old {name}'
+
+        @self.show.register(min_version=(1, 2))
+        def show_v1_2(name):
+            return f'new {name}'
+
+        self.show_v1_0 = show_v1_0
+
+    def test_dispatch(self):
+        self.show.finalize()
+        self.assertEqual('old cat', self.show((1, 0), 'cat'))
+        self.assertEqual('old cat', self.show((1, 1), name='cat'))
+        self.assertEqual('new cat', self.show((1, 2), 'cat'))
+        self.assertEqual('new cat', self.show((1, 3), 'cat'))
+
+    def test_decorator_returns_handler(self):
+        self.assertEqual('old dog', self.show_v1_0('dog'))
+
+    def test_extracted_version(self):
+        version = microversion_parse.extract_version(
+            {'openstack-api-version': 'cats 1.1'}, 'cats', VERSIONS
+        )
+        self.assertIs(self.show_v1_0, self.show.handler(version))
+
+    def test_finalized_on_first_dispatch(self):
+        self.assertEqual('new cat', self.show((1, 3), 'cat'))
+
+    def test_unacceptable_version(self):
+        self.assertRaises(ValueError, self.show, (1, 4), 'cat')
+
+    def test_register_after_finalize(self):
+        self.show.finalize()
+        self.assertRaises(TypeError, self.show.register, '1.0')
+
+    def test_overlap(self):
+        @self.show.register('1.1', '1.2')
+        def show_v1_1(name):
+            return name
+
+        exc = self.assertRaises(ValueError, self.show.finalize)
+        self.assertIn('More than one handler for version 1.1', str(exc))
+        self.assertIn('show_v1_0', str(exc))
+        self.assertIn('show_v1_1', str(exc))
+
+    def test_gap(self):
+        show = microversion_parse.VersionDispatcher(
+            microversion_parse.VersionSet(VERSIONS)
+        )
+        show.register(max_version='1.0')(str)
+        show.register(min_version='1.2')(repr)
+        exc = self.assertRaises(ValueError, show.finalize)
+        self.assertEqual('No handler for version 1.1', str(exc))
@@ -0,0 +1,99 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+import testtools
+
+import microversion_parse
+
+
+class TestVersionRangeIndex(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = microversion_parse.VersionRangeIndex(
+            [
+                (None, '1.4', 'old'),
+                ('1.2', '1.9', 'middle'),
+                ('1.5', None, 'new'),
+                ((1, 7), (1, 7), 'only-1.7'),
+            ]
+        )
+
+    def test_lookup(self):
+        self.assertEqual(('old',), self.index.lookup('1.0'))
+        self.assertEqual(('old', 'middle'), self.index.lookup((1, 2)))
+        self.assertEqual(('old', 'middle'), self.index.lookup((1, 4)))
+        self.assertEqual(('middle', 'new'), self.index.lookup((1, 5)))
+        self.assertEqual(
+            ('middle', 'new', 'only-1.7'), self.index.lookup((1, 7))
+        )
+        self.assertEqual(('new',), self.index.lookup((1, 10)))
+        self.assertEqual(('new',), self.index.lookup((2, 0)))
+
+    def test_lookup_version(self):
+        version = microversion_parse.Version(
+            1, 3, min_version=(1, 0), max_version=(1, 9)
+        )
+        self.assertEqual(('old', 'middle'), self.index[version])
+
+    def test_first(self):
+        self.assertEqual('old', self.index.first('1.3'))
+        self.assertEqual('new', self.index.first('1.10'))
+        index = microversion_parse.VersionRangeIndex([('1.1', '1.2', 'a')])
+        self.assertIsNone(index.first('1.0'))
+        self.assertEqual('b', index.first('1.3', default='b'))
+
+    def test_empty(self):
+        index: microversion_parse.VersionRangeIndex[str]
+        index = microversion_parse.VersionRangeIndex([])
+        self.assertEqual((), index.lookup((1, 0)))
+
+    def test_invalid_range(self):
+        self.assertRaises(
+            ValueError,
+            microversion_parse.VersionRangeIndex,
+            [('1.5', '1.4', 'backwards')],
+        )
+
+    def test_precomputed_versions(self):
+        versions = microversion_parse.VersionSet(['1.0', '1.1', '1.2'])
+        index = microversion_parse.VersionRangeIndex(
+            [('1.1', None, 'new')], versions
+        )
+        self.assertIs(index.lookup(versions.select('1.1')), index[(1, 2)])
+        self.assertEqual((), index.lookup((1, 0)))
+        # Versions which were not precomputed are still found.
+        self.assertEqual(('new',), index.lookup((3, 0)))
+
+    def test_matches(self):
+        # The index agrees with Version.matches.
+        rng = random.Random(42)
+        entries = []
+        for number in range(50):
+            low = (rng.randint(0, 2), rng.randint(0, 20))
+            high = (rng.randint(low[0], 3), rng.randint(0, 20))
+            if high < low:
+                low, high = high, low
+            entries.append((low, high, number))
+        index = microversion_parse.VersionRangeIndex(entries)
+        for major in range(4):
+            for minor in range(22):
+                version = microversion_parse.Version(major, minor)
+                expected = tuple(
+                    number
+                    for low, high, number in entries
+                    if version.matches(low, high)
+                )
+                self.assertEqual(expected, index.lookup(version))
@@ -11,6 +11,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest import mock
+
 import testtools
 
 from webob import headers as wb_headers
@@ -93,3 +95,26 @@ class TestWebobHeaders(testtools.TestCase):
             legacy_headers=['x-openstack-nova-api-version'],
         )
         self.assertEqual('9.2', version)
+
+    def test_get_version_no_fold(self):
+        headers = wb_headers.EnvironHeaders(
+            {
+                'HTTP_HEADER_ONE': 'alpha',
+                'HTTP_OPENSTACK_API_VERSION': 'network 5.9, compute 2.1',
+            }
+        )
+        with mock.patch.object(
+            microversion_parse, 'fold_headers'
+        ) as fold_headers:
+            version = microversion_parse.get_version(headers, 'compute')
+        self.assertEqual('2.1', version)
+        fold_headers.assert_not_called()
+
+    def test_get_version_absent(self):
+        headers = wb_headers.EnvironHeaders({'HTTP_HEADER_ONE': 'alpha'})
+        version = microversion_parse.get_version(
+            headers,
+            service_type='compute',
+            legacy_headers=['x-openstack-nova-api-version'],
+        )
+        self.assertIsNone(version)
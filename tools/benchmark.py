@@ -0,0 +1,456 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks for the microversion parsing and middleware hot paths.
+
+Each benchmark is run in a number of rounds, each calling the benchmarked
+function many times, to report the throughput. Many single calls are then
+timed, less the cost of reading the clock, to report the percentiles of
+the latency of a call, along with the peak memory allocated by a single
+call. Results can be saved as a baseline and later runs compared against
+it::
+
+    python tools/benchmark.py --save tools/benchmark-baseline.json
+    python tools/benchmark.py --compare tools/benchmark-baseline.json
+
+Baselines are only comparable when taken on the same machine with the same
+Python.
+"""
+
+import argparse
+from collections.abc import Callable, Iterable
+import functools
+import json
+import platform
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any
+
+import webob
+from webob import headers as wb_headers
+
+import microversion_parse
+from microversion_parse import middleware
+
+SERVICE_TYPE = 'compute'
+LEGACY_HEADERS = ['x-openstack-nova-api-version']
+
+
+def _versions_list(size: int) -> list[str]:
+    """Make a versions list of about size versions."""
+    return [
+        f'{major}.{minor}' for major in (1, 2) for minor in range(size // 2)
+    ]
+
+
+def _headers(heavy: bool, **extra: str) -> dict[str, str]:
+    """Make request headers, with or without many large headers."""
+    headers = {
+        'host': 'compute.example.com',
+        'accept': 'application/json',
+        'user-agent': 'python-novaclient',
+    }
+    if heavy:
+        headers['x-auth-token'] = 'gAAAAA' + 'x' * 4000
+        headers['cookie'] = '; '.join(f'c{i}={"v" * 60}' for i in range(40))
+        for i in range(40):
+            headers[f'x-extra-header-{i}'] = f'value {i}'
+    headers.update(extra)
+    return headers
+
+
+def _environ(headers: dict[str, str]) -> dict[str, Any]:
+    """Make a WSGI environ with headers."""
+    environ = webob.Request.blank('/servers').environ
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+def _app(environ: dict[str, Any], start_response: Any) -> list[bytes]:
+    start_response('200 OK', [('content-type', 'application/json')])
+    return [b'{}']
+
+
+def _start_response(
+    status: str, headers: list[tuple[str, str]], exc_info: Any = None
+) -> Callable[[bytes], object]:
+    return lambda data: None
+
+
+def _expect(
+    exc_type: type[Exception], func: Callable[..., object], *args: Any
+) -> None:
+    """Call func, which is expected to raise exc_type."""
+    try:
+        func(*args)
+    except exc_type:
+        return
+    raise AssertionError(f'{exc_type.__name__} not raised')
+
+
+def _call_wsgi(application: Any, environ: dict[str, Any]) -> None:
+    """Call a WSGI application and consume its response."""
+    for _ in application(dict(environ), _start_response):
+        pass
+
+
+def benchmarks() -> dict[str, Callable[[], object]]:
+    """Make the named benchmark functions."""
+    cases: dict[str, Callable[[], object]] = {}
+    fold_headers = microversion_parse.fold_headers
+    get_version = microversion_parse.get_version
+    headers_from_wsgi_environ = microversion_parse.headers_from_wsgi_environ
+
+    for weight in ('small', 'heavy'):
+        heavy = weight == 'heavy'
+        present = _headers(heavy, **{'openstack-api-version': 'compute 2.1'})
+        latest = _headers(heavy, **{'openstack-api-version': 'compute latest'})
+        absent = _headers(heavy)
+        multi = _headers(
+            heavy,
+            **{
+                'openstack-api-version': (
+                    'compute 2.1, placement 1.30, volume 3.0, image 2.5'
+                )
+            },
+        )
+        legacy = _headers(heavy, **{'x-openstack-nova-api-version': '2.1'})
+        listed = list(present.items())
+        raw = [
+            (name.encode('latin-1'), value.encode('latin-1'))
+            for name, value in listed
+        ]
+        environ = _environ(present)
+        environ_absent = _environ(absent)
+        cache = microversion_parse.HeaderCache()
+        legacy_lookup = microversion_parse.HeaderLookup(
+            SERVICE_TYPE, LEGACY_HEADERS
+        )
+
+        for name, func in (
+            ('fold-dict', functools.partial(fold_headers, present)),
+            ('fold-list', functools.partial(fold_headers, listed)),
+            (
+                'headers-from-environ',
+                functools.partial(headers_from_wsgi_environ, environ),
+            ),
+            (
+                'get-environ-view',
+                functools.partial(
+                    get_version,
+                    microversion_parse.WSGIEnvironHeaders(environ),
+                    SERVICE_TYPE,
+                ),
+            ),
+            (
+                'get-dict',
+                functools.partial(get_version, present, SERVICE_TYPE),
+            ),
+            ('get-list', functools.partial(get_version, listed, SERVICE_TYPE)),
+            (
+                'get-bytes-list',
+                functools.partial(get_version, raw, SERVICE_TYPE),
+            ),
+            (
+                'get-webob',
+                functools.partial(
+                    get_version,
+                    wb_headers.EnvironHeaders(environ),
+                    SERVICE_TYPE,
+                ),
+            ),
+            (
+                'get-environ',
+                functools.partial(get_version, environ, SERVICE_TYPE),
+            ),
+            (
+                'get-multi-service',
+                functools.partial(get_version, multi, SERVICE_TYPE),
+            ),
+            (
+                'get-latest',
+                functools.partial(get_version, latest, SERVICE_TYPE),
+            ),
+            (
+                'get-absent',
+                functools.partial(get_version, absent, SERVICE_TYPE),
+            ),
+            (
+                'get-absent-environ',
+                functools.partial(get_version, environ_absent, SERVICE_TYPE),
+            ),
+            (
+                'get-absent-legacy',
+                functools.partial(
+                    get_version, absent, SERVICE_TYPE, LEGACY_HEADERS
+                ),
+            ),
+            (
+                'get-legacy',
+                functools.partial(
+                    get_version, legacy, SERVICE_TYPE, LEGACY_HEADERS
+                ),
+            ),
+            (
+                'get-legacy-lookup',
+                functools.partial(get_version, legacy, legacy_lookup),
+            ),
+            (
+                'get-cached',
+                functools.partial(
+                    get_version, present, SERVICE_TYPE, cache=cache
+                ),
+            ),
+        ):
+            cases[f'{name}-{weight}'] = func
+
+    headers = _headers(False, **{'openstack-api-version': 'compute 2.1'})
+    for size in (10, 100, 1000):
+        versions = _versions_list(size)
+        version_set = microversion_parse.VersionSet(versions)
+        cases[f'extract-list-{size}'] = functools.partial(
+            microversion_parse.extract_version, headers, SERVICE_TYPE, versions
+        )
+        cases[f'extract-version-set-{size}'] = functools.partial(
+            version_set.extract, headers, SERVICE_TYPE
+        )
+
+    versions = _versions_list(100)
+    # Only the microversion header among a couple of others, in a dict and
+    # in a list, as for most requests.
+    small = {
+        'content-type': 'application/json',
+        'openstack-api-version': 'compute 2.1',
+        'accept': '*/*',
+    }
+    cases['extract-small-dict'] = functools.partial(
+        microversion_parse.extract_version, small, SERVICE_TYPE, versions
+    )
+    cases['extract-small-list'] = functools.partial(
+        microversion_parse.extract_version,
+        list(small.items()),
+        SERVICE_TYPE,
+        versions,
+    )
+    version_set = microversion_parse.VersionSet(versions)
+    cases['extract-version-set-cached'] = functools.partial(
+        version_set.extract,
+        headers,
+        SERVICE_TYPE,
+        cache=microversion_parse.HeaderCache(),
+    )
+    cases['extract-absent'] = functools.partial(
+        version_set.extract, _headers(False), SERVICE_TYPE
+    )
+    cases['extract-latest'] = functools.partial(
+        version_set.extract,
+        _headers(False, **{'openstack-api-version': 'compute latest'}),
+        SERVICE_TYPE,
+    )
+    not_acceptable = _headers(
+        False, **{'openstack-api-version': 'compute 9.9'}
+    )
+    cases['extract-error-406'] = functools.partial(
+        _expect, ValueError, version_set.extract, not_acceptable, SERVICE_TYPE
+    )
+    bad_request = _headers(False, **{'openstack-api-version': 'compute 2.x'})
+    cases['extract-error-400'] = functools.partial(
+        _expect, TypeError, version_set.extract, bad_request, SERVICE_TYPE
+    )
+
+    for name, middleware_class in (
+        ('middleware', middleware.MicroversionMiddleware),
+        ('fast-middleware', middleware.FastMicroversionMiddleware),
+    ):
+        application = middleware_class(_app, SERVICE_TYPE, versions)
+        for kind, request_headers in (
+            ('present', headers),
+            ('error-406', not_acceptable),
+        ):
+            cases[f'{name}-{kind}'] = functools.partial(
+                _call_wsgi, application, _environ(request_headers)
+            )
+    return cases
+
+
+def _calibrate(func: Callable[[], object], round_time: float) -> int:
+    """Find the number of calls which take about round_time."""
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= round_time / 10:
+            return max(1, int(calls * round_time / elapsed))
+        calls *= 10
+
+
+def _call_latencies(func: Callable[[], object], samples: int) -> list[float]:
+    """Time single calls, in seconds, less the cost of reading the clock."""
+    clock = time.perf_counter_ns
+    overhead = min(-clock() + clock() for _ in range(1000))
+    latencies = []
+    for _ in range(samples):
+        start = clock()
+        func()
+        latencies.append(max(0, clock() - start - overhead) / 1e9)
+    return latencies
+
+
+def _peak_allocation(func: Callable[[], object], calls: int = 20) -> int:
+    """Get the median peak memory allocated by a single call, in bytes."""
+    func()
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    return int(statistics.median(peaks))
+
+
+def run(
+    func: Callable[[], object], rounds: int, round_time: float, samples: int
+) -> dict[str, float]:
+    """Run one benchmark, returning its results."""
+    calls = _calibrate(func, round_time)
+    round_latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        round_latencies.append((time.perf_counter() - start) / calls)
+    percentiles = statistics.quantiles(
+        _call_latencies(func, samples), n=100, method='inclusive'
+    )
+    return {
+        'ops_per_sec': round(1 / statistics.mean(round_latencies)),
+        'p50_us': round(percentiles[49] * 1e6, 3),
+        'p90_us': round(percentiles[89] * 1e6, 3),
+        'p99_us': round(percentiles[98] * 1e6, 3),
+        'peak_alloc_bytes': _peak_allocation(func),
+    }
+
+
+def report(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]] | None,
+) -> list[str]:
+    """Print results, returning the names of any which got slower."""
+    print(
+        f'{"benchmark":<34} {"ops/sec":>12} {"p50 us":>8} {"p90 us":>8} '
+        f'{"p99 us":>8} {"alloc B":>8} {"vs base":>8}'
+    )
+    regressions = []
+    for name, result in results.items():
+        change = ''
+        if baseline and name in baseline:
+            ratio = result['p50_us'] / baseline[name]['p50_us']
+            change = f'{ratio:7.2f}x'
+            regressions.append((name, ratio))
+        print(
+            f'{name:<34} {result["ops_per_sec"]:>12,.0f} '
+            f'{result["p50_us"]:>8.2f} {result["p90_us"]:>8.2f} '
+            f'{result["p99_us"]:>8.2f} '
+            f'{result["peak_alloc_bytes"]:>8.0f} {change:>8}'
+        )
+    return [name for name, ratio in regressions if ratio > 1]
+
+
+def main(argv: Iterable[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        'pattern',
+        nargs='?',
+        default='',
+        help='Only run benchmarks whose names match this regex.',
+    )
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument(
+        '--round-time',
+        type=float,
+        default=0.02,
+        help='Seconds each round should take.',
+    )
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=10000,
+        help='Single calls to time for the latency percentiles.',
+    )
+    parser.add_argument(
+        '--save', metavar='FILE', help='Save the results as a baseline.'
+    )
+    parser.add_argument(
+        '--compare', metavar='FILE', help='Compare with a saved baseline.'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=None,
+        help='Exit non-zero if any median latency is more than this '
+        'fraction slower than the baseline, for example 0.2.',
+    )
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    pattern = re.compile(args.pattern)
+    results = {
+        name: run(func, args.rounds, args.round_time, args.samples)
+        for name, func in benchmarks().items()
+        if pattern.search(name)
+    }
+    slower = report(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(
+                {
+                    'python': sys.version.split()[0],
+                    'platform': platform.platform(),
+                    'results': results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write('\n')
+
+    if args.threshold is not None and baseline:
+        failed = [
+            name
+            for name in slower
+            if results[name]['p50_us']
+            > baseline[name]['p50_us'] * (1 + args.threshold)
+        ]
+        if failed:
+            print(f'Slower than baseline: {", ".join(failed)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())